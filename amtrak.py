@@ -28,10 +28,9 @@ itinerary e-mail that is supported for the parsers in this repo.
 from __future__ import unicode_literals
 import copy
 import json
-import arrow
 import sys
 
-from modules import parsers
+from modules import metrics, parsers
 
 
 class AmtrakServiceParser(object):
@@ -63,7 +62,8 @@ class AmtrakServiceParser(object):
         self.arrival_date = None
         self.accommodation = None
 
-    def parse(self, line):
+    @metrics.timed("parse")
+    def parse(self, line, format_name=parsers.DEFAULT_FORMAT):
         """Parse one line of the amtrak itinerary.
 
         It will add information to the parser until last item has been parsed,
@@ -71,6 +71,7 @@ class AmtrakServiceParser(object):
 
         Args:
             line (str): A line of an amtrak itinerary.
+            format_name (str): Format of the itinerary (see `parsers`).
 
         Returns:
             dict: All the information parsed of a single service.
@@ -88,7 +89,9 @@ class AmtrakServiceParser(object):
                 "accommodation": "1 Reserved Coach Seat"}
         """
 
-        for parser in parsers.get_parsers():
+        metrics.incr("lines_parsed")
+
+        for parser in parsers.get_parsers(format_name):
             if parser.accepts(line):
                 key, value = parser.parse(line)
 
@@ -105,6 +108,7 @@ class AmtrakServiceParser(object):
         if self._service_info_complete():
             RV = copy.copy(self.__dict__)
             self.__init__()
+            metrics.incr("services_parsed")
         else:
             RV = None
 
@@ -127,14 +131,49 @@ def parse_services(filename='trip.txt'):
         dict: New record with data about a service.
     """
 
+    with open(filename, 'rb') as f:
+        for new_record in parse_text(f.read()):
+            yield new_record
+
+
+def parse_text(text):
+    """Parse all services from the text of an amtrak itinerary.
+
+    The format of the itinerary is sniffed once for the whole text, so only
+    the parsers of that format are tried on each line.
+
+    Args:
+        text (str): Text of an amtrak itinerary.
+
+    Yields:
+        dict: New record with data about a service.
+    """
+
+    format_name = parsers.sniff_format(text)
+    lines = parsers.get_profile(format_name).split_lines(text)
+
+    for new_record in parse_lines(lines, format_name):
+        yield new_record
+
+
+def parse_lines(lines, format_name=parsers.DEFAULT_FORMAT):
+    """Parse all services from the lines of an amtrak itinerary.
+
+    Args:
+        lines (iterable): Lines of an amtrak itinerary.
+        format_name (str): Format of the itinerary (see `parsers`).
+
+    Yields:
+        dict: New record with data about a service.
+    """
+
     parser = AmtrakServiceParser()
 
-    with open(filename, 'rb') as f:
-        for line in f.readlines():
-            new_record = parser.parse(line)
+    for line in lines:
+        new_record = parser.parse(line, format_name)
 
-            if new_record:
-                yield new_record
+        if new_record:
+            yield new_record
 
 
 def add_calc_fields(service):
@@ -145,6 +184,8 @@ def add_calc_fields(service):
 
 def _calc_duration(service):
     """Calculates the duration of a service."""
+    import arrow
+
     duration = arrow.get(service["arrival_date"]) - \
         arrow.get(service["departure_date"])
     return round(duration.total_seconds() / 60 / 60, 1)
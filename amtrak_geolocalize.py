@@ -30,14 +30,34 @@ trip data?).
 
 from __future__ import unicode_literals
 import json
-import shapefile
-from fuzzywuzzy import process
-import arrow
-import requests
 import os
+import threading
 from pprint import pprint
+
+from modules import gazetteer, metrics, topojson
 # from graph import rail_graph
 
+ZOOM_LEVELS = [4, 6, 8, 10]
+
+# compiled gazetteers already opened, with their modification time, by path
+_gazetteers = {}
+
+# time zone ids already retrieved, by coordinates
+_tz_cache = {}
+
+# rail node ids already found, by coordinates
+_node_ids_cache = {}
+
+# spatial indexes of rail nodes already loaded, by path
+_node_indexes = {}
+
+# coordinates of every node of the rail_nodes shapefile, by node id
+_nodes_coordinates = {}
+_nodes_coordinates_lock = threading.Lock()
+
+# shared rail graph of a trip routing worker process
+_worker_graph = None
+
 
 def load_services(file_name="./json/amtrak-trip.json"):
     """Load a json file with parsed services from an amtrak itinerary."""
@@ -59,7 +79,7 @@ def geolocalize_stations(service, shp_file="amtrk_sta/amtrk_sta"):
             service[coord_key] = find_coordinates(station, shp_file)
 
 
-def correct_time_zones(service):
+def correct_time_zones(service, shp_file="amtrk_sta/amtrk_sta"):
     """Correct parsed dates with corresponding time zones.
 
     Uses the coordinates found for every station and the Google Time Zone API
@@ -67,40 +87,83 @@ def correct_time_zones(service):
 
     Args:
         service (dict): A parsed amtrak service.
+        shp_file (str): Path to a shapefile of amtrak stations.
     """
+    correct_services_time_zones([service], shp_file)
 
-    for key, coordinates in service.items():
-        if "coordinates" in key:
-            arrival_or_depart = key.replace("_coordinates", "")
-            date_key = arrival_or_depart + "_date"
-            date = arrow.get(service[date_key])
-            timestamp = date.timestamp
 
-            tzinfo = _get_tz(coordinates, timestamp)
-            dt_tuple = (date.year, date.month, date.day, date.hour,
-                        date.minute)
+@metrics.timed("correct_time_zones")
+def correct_services_time_zones(services, shp_file="amtrk_sta/amtrk_sta"):
+    """Correct parsed dates of many services with their time zones at once.
+
+    Dates are kept as local epochs while the time zone of every station is
+    retrieved, then the UTC offsets of all of them are resolved together,
+    grouped by time zone, and dates are only formatted back at the end.
+
+    Time zones stored in the compiled gazetteer of the stations are used if
+    there is one, only stations without a time zone there go to the Google
+    Time Zone API.
+
+    Args:
+        services (list): Parsed amtrak services with coordinates.
+        shp_file (str): Path to a shapefile of amtrak stations.
+    """
+    from modules import time_zones
 
-            service[date_key] = arrow.get(*dt_tuple, tzinfo=tzinfo).isoformat()
+    stations_gazetteer = _get_gazetteer(shp_file)
 
+    date_keys, local_epochs, tzids = [], [], []
+    for service in services:
+        for key, coordinates in service.items():
+            if "coordinates" in key:
+                date_key = key.replace("_coordinates", "") + "_date"
+                local_epoch = time_zones.parse_iso(service[date_key])[0]
 
+                # only hours and minutes of the parsed dates are meaningful
+                local_epoch -= local_epoch % 60
+
+                tzid = None
+                station_key = key.replace("coordinates", "station")
+                if stations_gazetteer is not None and station_key in service:
+                    tzid = stations_gazetteer.find(
+                        service[station_key])["timezone"]
+
+                date_keys.append((service, date_key))
+                local_epochs.append(local_epoch)
+                tzids.append(tzid or _get_tz(coordinates, local_epoch))
+
+    offsets = time_zones.resolve_offsets(local_epochs, tzids)
+
+    for (service, date_key), local_epoch, offset in zip(date_keys,
+                                                        local_epochs,
+                                                        offsets.tolist()):
+        service[date_key] = time_zones.format_iso(local_epoch, offset)
+    metrics.incr("dates_normalized", len(local_epochs))
+
+
+@metrics.timed("get_tz")
 def _get_tz(coordinates, timestamp):
     """Get the timezone of a point in a certain time.
 
-    Use the Google Time Zone API to get it.
+    Use the Google Time Zone API to get it. The time zone id of a place
+    doesn't change with time, so ids are cached by coordinates for the life
+    of the process.
 
     Args:
         coordinates (list): Given coordinates [lon, lat].
         timestamp (int): Unix timestamp (necessary to retrieve take into
             account Daylight Saving Time schemes).
     """
+    from modules.time_zones import google_time_zone
 
-    payload = {"location": ",".join([unicode(i) for i in
-                                     reversed(coordinates)]),
-               "timestamp": timestamp,
-               "key": os.environ["GOOGLE_API_KEY"]}
-    url = "https://maps.googleapis.com/maps/api/timezone/json"
+    if tuple(coordinates) in _tz_cache:
+        metrics.incr("tz_cache_hits")
+        return _tz_cache[tuple(coordinates)]
 
-    return requests.get(url, payload).json()["timeZoneId"]
+    metrics.incr("tz_requests")
+    _tz_cache[tuple(coordinates)] = google_time_zone(coordinates, timestamp)
+
+    return _tz_cache[tuple(coordinates)]
 
 
 def add_duration(service):
@@ -111,11 +174,14 @@ def add_duration(service):
 
 def _calc_duration(service):
     """Calculates the duration of a service."""
-    duration = arrow.get(service["arrival_date"]) - \
-        arrow.get(service["departure_date"])
-    return round(duration.total_seconds() / 60 / 60, 1)
+    from modules.time_zones import to_utc_epoch
+
+    duration = to_utc_epoch(service["arrival_date"]) - \
+        to_utc_epoch(service["departure_date"])
+    return round(duration / 60.0 / 60, 1)
 
 
+@metrics.timed("find_coordinates")
 def find_coordinates(station, shp_file="amtrk_sta/amtrk_sta"):
     """Find coordinates for a given amtrak station.
 
@@ -123,11 +189,22 @@ def find_coordinates(station, shp_file="amtrk_sta/amtrk_sta"):
         station (str): Amtrak station.
         shp_file (str): Path to a shapefile of amtrak stations.
     Returns:
-        list: Coordinates pulled from the amtrak stations shapefile
+        list: Coordinates pulled from the amtrak stations shapefile (or its
+            compiled gazetteer, if there is one)
             [-122.29068, 37.840679]
             [lon, lat]
     """
 
+    stations_gazetteer = _get_gazetteer(shp_file)
+    if stations_gazetteer is not None:
+        metrics.incr("gazetteer_lookups")
+        coordinates = stations_gazetteer.find(station)["coordinates"]
+        return [round(coord, 6) for coord in coordinates]
+
+    import shapefile
+    from fuzzywuzzy import process
+
+    metrics.incr("shapefile_lookups")
     sf = shapefile.Reader(shp_file)
 
     # find index of station
@@ -143,6 +220,52 @@ def find_coordinates(station, shp_file="amtrk_sta/amtrk_sta"):
     return coordinates
 
 
+def find_station_node(station, shp_file="amtrk_sta/amtrk_sta"):
+    """Find the id of the rail node nearest to a given amtrak station.
+
+    The node precomputed in the compiled gazetteer is used if there is one,
+    otherwise the station coordinates are looked up in the rail_nodes
+    shapefile.
+
+    Args:
+        station (str): Amtrak station.
+        shp_file (str): Path to a shapefile of amtrak stations.
+    Returns:
+        int: Id of the node in the rail_nodes shapefile or None if there is
+            no node close enough to the station.
+    """
+
+    stations_gazetteer = _get_gazetteer(shp_file)
+    if stations_gazetteer is not None:
+        return stations_gazetteer.find(station)["node_id"]
+
+    return _get_node_id(find_coordinates(station, shp_file))
+
+
+def _get_gazetteer(shp_file):
+    """Open the compiled gazetteer of a stations shapefile, if there is one.
+
+    The gazetteer is expected next to the shapefile with a .gaz extension
+    (see `modules/gazetteer.py`) and is only used if it is not older than
+    the shapefile it was built from. Its modification time is checked every
+    time, so a gazetteer rebuilt while the process runs is opened again.
+    """
+
+    file_name = shp_file + ".gaz"
+    try:
+        mtime = os.path.getmtime(file_name)
+    except OSError:
+        return None
+
+    if file_name not in _gazetteers or _gazetteers[file_name][0] != mtime:
+        if mtime < os.path.getmtime(shp_file + ".dbf"):
+            return None
+        # an older version may still be in use, it is closed once released
+        _gazetteers[file_name] = (mtime, gazetteer.Gazetteer(file_name))
+
+    return _gazetteers[file_name][1]
+
+
 def create_line(service):
     """Create a line from departure station to arrival station of a service."""
     return _coords_to_line(service["departure_coordinates"],
@@ -159,89 +282,320 @@ def create_point(coordinates):
     return {"type": "Point", "coordinates": coordinates}
 
 
-def load_amtrak_path(service, graph):
-    """TODO: It will load a real amtrak path for a service."""
+def create_stations_table(services):
+    """Normalize services into a stations table and services referencing it.
+
+    Each station is written once, with an integer id, its coordinates and
+    the list of every visit made to it during the trip. Services keep their
+    own data but reference stations by id instead of carrying coordinates.
+
+    Args:
+        services (list): Geolocalized services.
+    Returns:
+        dict: With a "stations" list and a "services" list.
+
+        Example:
+            {"stations": [{"station_id": 0,
+                           "station": "Emeryville, California",
+                           "city": "Emeryville",
+                           "state": "California",
+                           "the_geom": {"type": "Point",
+                                        "coordinates": [-122.29, 37.84]},
+                           "visits": [{"service": "5 California Zephyr",
+                                       "arrival_date": "2015-05-22T..."},
+                                      {"service": "712 San Joaquin",
+                                       "departure_date": "2015-05-26T..."}]}],
+             "services": [{"name": "712 San Joaquin",
+                           "departure_station_id": 0,
+                           "arrival_station_id": 1, ...}]}
+    """
+
+    stations, stations_ids, normalized_services = [], {}, []
+    for service in services:
+        normalized_service = {key: value for key, value in service.items()
+                              if not key.startswith("departure_") and
+                              not key.startswith("arrival_") and
+                              key != "the_geom"}
+
+        # departure is always visited before arrival
+        for arrival_or_depart in ["departure", "arrival"]:
+            station = service[arrival_or_depart + "_station"]
+            date_key = arrival_or_depart + "_date"
+
+            if station not in stations_ids:
+                stations_ids[station] = len(stations)
+                stations.append({
+                    "station_id": stations_ids[station],
+                    "station": station,
+                    "city": service[arrival_or_depart + "_city"],
+                    "state": service[arrival_or_depart + "_state"],
+                    "the_geom": create_point(
+                        service[arrival_or_depart + "_coordinates"]),
+                    "visits": []})
+
+            stations[stations_ids[station]]["visits"].append(
+                {"service": service["name"], date_key: service[date_key]})
+
+            normalized_service[arrival_or_depart + "_station_id"] = \
+                stations_ids[station]
+            normalized_service[date_key] = service[date_key]
+
+        normalized_services.append(normalized_service)
+
+    return {"stations": stations, "services": normalized_services}
+
+
+def load_amtrak_path(service, graph, cache=None):
+    """Load the real amtrak path of a service, following the rail network.
+
+    Args:
+        service (dict): A geolocalized amtrak service.
+        graph (Graph): Rail graph.
+        cache (RouteCache): Cache of routes already found, if any.
+    Returns:
+        dict: Geojson formated MultiLineString of the path.
+    """
     return _find_amtrak_path(service["departure_coordinates"],
                              service["arrival_coordinates"],
-                             graph)
+                             graph, cache)
 
 
-def _find_amtrak_path(origin, destination, graph):
-    """
-    TODO
+def _find_amtrak_path(origin, destination, graph, cache=None):
+    """Find the rail path between two coordinates.
 
     1. Identify origin and destination ids in rail_nodes shapefile
-    2. Build rail_lines graph
-    3. Find shortest path in rail_lines graph from O to D
-    4. Build MultiLineString geojson from rail_lines graph shortest path
+    2. Find shortest path in rail_lines graph from O to D (or get it from
+        the cache)
+    3. Build MultiLineString geojson from rail_lines graph shortest path
         identified
+
+    A straight line is used if there is no rail path between them.
     """
 
     id_origin = _get_node_id(origin)
     id_destination = _get_node_id(destination)
-    path = graph.find_shortest_path(id_origin, id_destination)
-#
-    return _path_to_geojson(path)
 
+    route = find_route(id_origin, id_destination, graph, cache)
+    if route is None:
+        return _coords_to_line(origin, destination)
 
-def _get_node_id(coordinates):
-    """Find a node id in the US rail_nodes shapefile given some coordinates."""
+    return route["the_geom"]
 
-    sf_nodes = shapefile.Reader("rail/rail_nodes")
-    points_generator = (shape.points[0] for shape in sf_nodes.iterShapes())
-    index = _find_aprox_coord(coordinates, points_generator)
 
-    if index != -1:
-        # return (sf_nodes.record(index), coordinates,
-                # sf_nodes.shape(index).points[0])
-        return sf_nodes.record(index)[0]
-    else:
+def find_route(id_origin, id_destination, graph, cache=None):
+    """Find the shortest rail route between two nodes of the rail network.
+
+    Args:
+        id_origin (int): Id of the origin node in the rail_nodes shapefile.
+        id_destination (int): Id of the destination node.
+        graph (Graph): Rail graph.
+        cache (RouteCache): Cache of routes already found, if any.
+    Returns:
+        dict: Distance in miles, ids of the nodes in the path and a geojson
+            formated MultiLineString of the path, or None if there is no
+            path between the nodes.
+
+        Example:
+            {"distance": 27.52,
+             "path": [100052, 100053, ...],
+             "the_geom": {"type": "MultiLineString",
+                          "coordinates": [[[-73.78, 42.64], ...]]}}
+    """
+
+    if cache is not None:
+        route = cache.get(id_origin, id_destination)
+        if route is not None:
+            return route
+
+    try:
+        distance, path = graph.find_shortest_path(id_origin, id_destination)
+    except KeyError:
+        metrics.incr("routes_not_found")
         return None
 
+    route = {"distance": distance, "path": path,
+             "the_geom": _path_to_geojson(path)}
+
+    if cache is not None:
+        cache.put(id_origin, id_destination, route)
+
+    return route
+
+
+def route_trip(services, graph, cache=None, pool=None):
+    """Find the rail routes of all the services of a trip.
+
+    Consecutive services share stations (each arrival is the next
+    departure), so every station is snapped to the rail network only once,
+    repeated legs are searched once and legs departing from the same node
+    are found in a single search from that node. Searches from different
+    origins are independent and run in `pool`, if one is given.
+
+    Args:
+        services (list): Geolocalized services, in trip order.
+        graph (Graph): Rail graph, or SharedGraph.
+        cache (RouteCache): Cache of routes already found, if any.
+        pool (multiprocessing.Pool): Worker processes searching the routes,
+            owned by the caller and started with `init_route_worker` and the
+            file of the shared graph, like `create_route_pool` does.
+    Returns:
+        list: Route of every service (as returned by `find_route`), in the
+            same order of the services. Services repeating a leg get their
+            own copy of the route. Services without a rail node near their
+            stations, or without a path between them, get None.
+    """
+    import copy
+
+    legs = [(_get_node_id(service["departure_coordinates"]),
+             _get_node_id(service["arrival_coordinates"]))
+            for service in services]
+
+    routes = {}
+    if cache is not None:
+        for leg in set(legs):
+            if None not in leg:
+                route = cache.get(*leg)
+                if route is not None:
+                    routes[leg] = route
+
+    # group the legs still to be found by their origin
+    destinations = {}
+    for id_origin, id_destination in legs:
+        if (id_origin, id_destination) not in routes and \
+                id_origin in graph and id_destination in graph:
+            destinations.setdefault(id_origin, set()).add(id_destination)
+    searches = [(id_origin, sorted(ids_destination)) for
+                id_origin, ids_destination in sorted(destinations.items())]
+
+    if pool is not None and len(searches) > 1:
+        paths = pool.map(_find_shortest_paths, searches)
+    else:
+        paths = [graph.find_shortest_paths(id_origin, ids_destination)
+                 for id_origin, ids_destination in searches]
+
+    for (id_origin, ids_destination), origin_paths in zip(searches, paths):
+        for id_destination in ids_destination:
+            if id_destination not in origin_paths:
+                metrics.incr("routes_not_found")
+                continue
+
+            distance, path = origin_paths[id_destination]
+            route = {"distance": distance, "path": path,
+                     "the_geom": _path_to_geojson(path)}
+            routes[(id_origin, id_destination)] = route
+
+            if cache is not None:
+                cache.put(id_origin, id_destination, route)
+
+    trip_routes, legs_done = [], set()
+    for leg in legs:
+        route = routes.get(leg)
+        trip_routes.append(copy.deepcopy(route) if leg in legs_done
+                           else route)
+        legs_done.add(leg)
+
+    return trip_routes
+
+
+def create_route_pool(graph, processes):
+    """Start worker processes for `route_trip`, attached to a shared graph.
+
+    Args:
+        graph (SharedGraph): Rail graph the workers map from its file.
+        processes (int): Number of worker processes.
+    Returns:
+        multiprocessing.Pool: The pool. The caller closes it when done.
+    """
+    from multiprocessing import Pool
+
+    return Pool(processes, initializer=init_route_worker,
+                initargs=(graph.file_name,))
+
+
+def init_route_worker(graph_file):
+    """Attach a worker process of a route pool to the shared graph."""
+    global _worker_graph
+    from modules.shared_graph import SharedGraph
+    _worker_graph = SharedGraph(graph_file)
 
-def _find_aprox_coord(coordinates, points_generator, threshold=0.001):
-    """Find the index of the closest point given some coordinates.
 
-    Iterate a points generator based on a shapefile trying to find the closest
-    point to some coordiantes with a threshold of maximum difference between
-    any of the coordinates (lon or lat).
+def _find_shortest_paths(search):
+    id_origin, ids_destination = search
+    return _worker_graph.find_shortest_paths(id_origin, ids_destination)
+
+
+def _get_node_id(coordinates):
+    """Find a node id in the US rail_nodes shapefile given some coordinates.
+
+    Node ids already found are remembered for the life of the process.
+    """
+
+    if tuple(coordinates) not in _node_ids_cache:
+        _node_ids_cache[tuple(coordinates)] = _find_node_id(coordinates)
+
+    return _node_ids_cache[tuple(coordinates)]
+
+
+def _find_node_id(coordinates):
+    return get_node_ids([coordinates])[0]
+
+
+def get_node_ids(coordinates):
+    """Find the node ids of many coordinates at once.
 
     Args:
-        coordinates (list): Given coordinates [lon, lat]
-        points_generator (generator): Yields coordinates [lon, lat] from a
-            shapefile.
-        threshold (float): Maximum percentual difference acceptable between any
-            coordinate (lon or lat).
+        coordinates (list): Coordinates [lon, lat] to find nodes for.
     Returns:
-        int: Index of the closest point or -1 if none is found within the
-            constraint given by the difference threshold.
+        list: Id of the nearest node in the rail_nodes shapefile of each
+            coordinate, or None if there is no node close enough.
     """
 
-    return_index, min_diff = -1, threshold
-    for index, coord in enumerate(points_generator):
-        diff = _calculate_coord_diff(coordinates, coord)
-        if diff < min_diff:
-            return_index, min_diff = index, diff
+    node_ids = _get_node_index().snap(coordinates)[0].tolist()
+    return [node_id if node_id >= 0 else None for node_id in node_ids]
+
+
+def _get_node_index(nodes_shp_file="rail/rail_nodes"):
+    """Load the spatial index of rail nodes the first time it is needed."""
 
-    return return_index
+    if nodes_shp_file not in _node_indexes:
+        from modules import snapping
 
+        _node_indexes[nodes_shp_file] = \
+            snapping.NodeIndex.from_shapefile(nodes_shp_file)
 
-def _calculate_coord_diff(coord_a, coord_b):
-    """Calculate the percentual difference between two coordinates.
+    return _node_indexes[nodes_shp_file]
 
-    It will be the maximum after comparing lon and lat coordinates.
+
+def _path_to_geojson(path, nodes_shp_file="rail/rail_nodes"):
+    """Create geojson formated line going through the nodes of a rail path.
 
     Args:
-        coord_a, coord_b (list): Given coordinates [lon, lat]
+        path (list): Ids of nodes in the rail_nodes shapefile.
+        nodes_shp_file (str): Path to the rail_nodes shapefile.
+    Raises:
+        ValueError: A node of the path is not in the rail_nodes shapefile.
     """
-    diff_x = abs(float(coord_a[0]) / coord_b[0] - 1)
-    diff_y = abs(float(coord_a[1]) / coord_b[1] - 1)
-    # print coord_a, coord_b, diff_x, diff_y
-    return max(diff_x, diff_y)
 
+    # request threads only see the coordinates once all of them are loaded
+    with _nodes_coordinates_lock:
+        if not _nodes_coordinates:
+            import shapefile
+
+            sf_nodes = shapefile.Reader(nodes_shp_file)
+            nodes_coordinates = {}
+            for shape, record in zip(sf_nodes.iterShapes(),
+                                     sf_nodes.iterRecords()):
+                nodes_coordinates[record[0]] = [round(coord, 6) for coord
+                                                in shape.points[0]]
+            _nodes_coordinates.update(nodes_coordinates)
 
-def _path_to_geojson(path):
-    pass
+    missing = [node for node in path if node not in _nodes_coordinates]
+    if missing:
+        raise ValueError("rail nodes {} are not in {}".format(
+            missing, nodes_shp_file))
+
+    return {"type": "MultiLineString",
+            "coordinates": [[_nodes_coordinates[node] for node in path]]}
 
 
 def to_geojson_format(services):
@@ -264,6 +618,42 @@ def to_geojson_format(services):
     return geojson_dict
 
 
+def to_topojson_format(geojson_dict, zoom=None, object_name="services"):
+    """Convert a geojson formated dict in a simplified topojson formated dict.
+
+    Args:
+        geojson_dict (dict): Geojson formated dict of services or points.
+        zoom (int): Zoom level of the web map the topojson is simplified for.
+            It won't be simplified if it is None.
+        object_name (str): Name of the topojson object of the features.
+    Returns:
+        dict: Formated like a topojson file, with lines sharing arcs.
+    """
+    return topojson.to_topology(geojson_dict, object_name=object_name,
+                                zoom=zoom)
+
+
+def write_services_to_topojson(geojson_dict, file_name, zooms=ZOOM_LEVELS,
+                               object_name="services"):
+    """Write one simplified topojson file for each zoom level.
+
+    Args:
+        geojson_dict (dict): Geojson formated dict of services or points.
+        file_name (str): Path of the files without extension. The zoom level
+            is added to the name of each file.
+        zooms (list): Zoom levels to write files for.
+        object_name (str): Name of the topojson object of the features.
+    """
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    for zoom in zooms:
+        topojson_dict = to_topojson_format(geojson_dict, zoom, object_name)
+        with open("{}-z{}.topojson".format(file_name, zoom), "w") as f:
+            f.write(json.dumps(topojson_dict, separators=(",", ":")))
+
+
 def write_services_to_json(services,
                            file_name="./json/amtrak-trip-geoloc.json"):
     with open(file_name, "w") as f:
@@ -273,12 +663,14 @@ def write_services_to_json(services,
 def main():
     services = load_services()
 
+    for service in services:
+        geolocalize_stations(service)
+    correct_services_time_zones(services)
+
     points_dict = {}
     for service in services:
 
         # create lines dict
-        geolocalize_stations(service)
-        correct_time_zones(service)
         add_duration(service)
         service["the_geom"] = create_line(service)
         # service["the_geom"] = load_amtrak_path(service)
@@ -313,6 +705,10 @@ def main():
         points_dict[service["arrival_city"]]["the_geom"] = \
             create_point(service["arrival_coordinates"])
 
+    # create normalized stations and services json file
+    write_services_to_json(create_stations_table(services),
+                           "./json/amtrak-trip-normalized.json")
+
     # create points json and geojson files
     # pprint(points_dict)
     write_services_to_json(points_dict.values(),
@@ -326,6 +722,7 @@ def main():
     # pprint(services)
     geojson_dict = to_geojson_format(services)
     write_services_to_json(geojson_dict, "./geojson/amtrak-trip-lines.geojson")
+    write_services_to_topojson(geojson_dict, "./topojson/amtrak-trip-lines")
 
 
 if __name__ == '__main__':
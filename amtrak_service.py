@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+amtrak_service
+
+Long running HTTP service to parse, geolocalize and route amtrak services.
+
+Running `amtrak.py` and `amtrak_geolocalize.py` for every itinerary reloads
+the stations and rebuilds the rail graph each time. The service keeps them
+in memory, together with the time zones already retrieved, and answers
+json requests:
+
+    GET  /health
+    POST /parse      {"text": "<amtrak itinerary e-mail>"}
+    POST /geolocate  {"services": [...], "correct_time_zones": false}
+    POST /route      {"origin": "<station>", "destination": "<station>"}
+                     {"origin_node": 1, "destination_node": 2}
+
+Routes already found are kept in a route cache, in memory and in a sqlite
+file next to the rail_lines shapefile.
+
+Requests are served by threads and shortest paths are searched in a pool of
+worker processes, so long searches don't block other requests. The rail
+graph is built once and every worker maps the same read-only copy of it
+(see `modules/shared_graph.py`).
+
+Example:
+    $ python amtrak_service.py
+    $ python amtrak_service.py 8080
+
+    import amtrak_service
+    service = amtrak_service.AmtrakService(processes=0)
+    client = amtrak_service.ServiceClient(service)
+    client.post("/parse", {"text": open("trip.txt").read()})
+"""
+
+from __future__ import unicode_literals
+import BaseHTTPServer
+import json
+import multiprocessing
+import SocketServer
+import sys
+import threading
+import traceback
+
+import amtrak
+import amtrak_geolocalize
+from modules import graph as rail_graph
+from modules import metrics, shared_graph
+from modules.route_cache import RouteCache, network_version
+
+DEFAULT_PORT = 8000
+
+SERVICE_FIELDS = ["departure_station", "departure_date", "arrival_station",
+                  "arrival_date"]
+
+# rail graph of a worker process, attached when the worker starts
+_worker_graph = None
+
+
+class RequestError(Exception):
+
+    """Error answered to the client with an HTTP status code."""
+
+    def __init__(self, status, message):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+
+class AmtrakService(object):
+
+    """Handle requests keeping stations, rail graph and time zones warm.
+
+    Attributes:
+        shp_file (str): Path to a shapefile of amtrak stations.
+        lines_shp_file (str): Path to the rail_lines shapefile.
+        processes (int): Number of worker processes searching shortest
+            paths. If it is 0 paths are searched in the calling thread.
+        graph (Graph): Rail graph used when there are no worker processes,
+            the shared rail graph is mapped when it is first needed if none
+            is given.
+        route_cache (RouteCache): Routes already found. If none is given, a
+            cache stored in a sqlite file next to the rail_lines shapefile is
+            opened with the first route request.
+    """
+
+    ENDPOINTS = {("GET", "/health"): "health",
+                 ("POST", "/parse"): "parse",
+                 ("POST", "/geolocate"): "geolocate",
+                 ("POST", "/route"): "route"}
+
+    def __init__(self, shp_file="amtrk_sta/amtrk_sta",
+                 lines_shp_file="rail/rail_lines", processes=2, graph=None,
+                 route_cache=None):
+        self.shp_file = shp_file
+        self.lines_shp_file = lines_shp_file
+        self.processes = processes
+        self.graph = graph
+        self.route_cache = route_cache
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes, attached to the shared rail graph."""
+
+        with self._lock:
+            if self.processes and not self._pool:
+                graph_file = rail_graph.get_amtrak_rail_graph(
+                    self.lines_shp_file).file_name
+                self._pool = multiprocessing.Pool(
+                    self.processes, initializer=_init_worker,
+                    initargs=(graph_file,))
+
+    def close(self):
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self.route_cache is not None:
+            self.route_cache.close()
+
+    def handle(self, method, path, body=None):
+        """Answer a request.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Path of the endpoint.
+            body (str): Json encoded body of the request.
+
+        Returns:
+            tuple: HTTP status code and the response, as a dict. Bad requests
+                are answered with a 4xx status and unexpected errors with a
+                500 status, both with an "error" message.
+        """
+
+        endpoint = self.ENDPOINTS.get((method, path.split("?")[0]))
+        if not endpoint:
+            return 404, {"error": "no endpoint for {} {}".format(method,
+                                                                 path)}
+
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"error": "body is not valid json"}
+        if not isinstance(data, dict):
+            return 400, {"error": "body must be a json object"}
+
+        metrics.incr("requests_" + endpoint)
+        try:
+            return 200, getattr(self, endpoint)(data)
+        except RequestError as e:
+            return e.status, {"error": unicode(e)}
+        except Exception as e:
+            traceback.print_exc()
+            metrics.incr("errors_" + endpoint)
+            return 500, {"error": "{}: {}".format(type(e).__name__, e)}
+
+    def health(self, data):
+        return {"status": "ok",
+                "route_cache": self.route_cache.stats() if self.route_cache
+                else None}
+
+    def parse(self, data):
+        """Parse the text of an amtrak itinerary."""
+        services = [amtrak.add_calc_fields(service) for service
+                    in amtrak.parse_text(_get_field(data, "text",
+                                                    basestring))]
+        return {"services": services}
+
+    def geolocate(self, data):
+        """Add coordinates and a line geometry to parsed services.
+
+        Time zones are only corrected, using the Google Time Zone API, if
+        "correct_time_zones" is true.
+        """
+
+        services = _get_field(data, "services", list)
+        for service in services:
+            _check_service(service)
+
+        for service in services:
+            amtrak_geolocalize.geolocalize_stations(service, self.shp_file)
+        if data.get("correct_time_zones"):
+            amtrak_geolocalize.correct_services_time_zones(services,
+                                                           self.shp_file)
+
+        for service in services:
+            amtrak_geolocalize.add_duration(service)
+            service["the_geom"] = amtrak_geolocalize.create_line(service)
+
+        return {"services": services}
+
+    def route(self, data):
+        """Find the shortest rail path between two stations or nodes."""
+
+        if "origin_node" in data:
+            origin_node = _get_field(data, "origin_node", (int, long))
+            destination_node = _get_field(data, "destination_node",
+                                          (int, long))
+        else:
+            origin_node = self._find_station_node(
+                _get_field(data, "origin", basestring))
+            destination_node = self._find_station_node(
+                _get_field(data, "destination", basestring))
+
+        graph = self._get_graph()
+        for node in [origin_node, destination_node]:
+            if node not in graph:
+                raise RequestError(404, "unknown rail node {}".format(node))
+
+        route = amtrak_geolocalize.find_route(
+            origin_node, destination_node, graph, self._get_route_cache())
+        if route is None:
+            raise RequestError(422, "no rail route between nodes {} and "
+                               "{}".format(origin_node, destination_node))
+
+        route = dict(route)
+        route.update({"origin_node": origin_node,
+                      "destination_node": destination_node})
+
+        return route
+
+    def _find_station_node(self, station):
+        node = amtrak_geolocalize.find_station_node(station, self.shp_file)
+        if node is None:
+            raise RequestError(422, "no rail node near station {}".format(
+                station))
+        return node
+
+    def _get_route_cache(self):
+        """Routes already found, opening the cache the first time."""
+
+        with self._lock:
+            if self.route_cache is None:
+                self.route_cache = RouteCache(
+                    file_name=self.lines_shp_file + ".routes.sqlite",
+                    network_version=network_version(self.lines_shp_file))
+
+        return self.route_cache
+
+    def _get_graph(self):
+        """Rail graph to search, in the worker processes if there are any."""
+
+        if self.processes:
+            self.start()
+            return PoolGraph(self._pool)
+
+        with self._lock:
+            if self.graph is None:
+                self.graph = rail_graph.get_amtrak_rail_graph(
+                    self.lines_shp_file)
+
+        return self.graph
+
+
+class PoolGraph(object):
+
+    """Search shortest paths in the rail graphs of a pool of workers."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __contains__(self, node):
+        return self.pool.apply(_has_node, (node,))
+
+    def find_shortest_path(self, node_a, node_b):
+        return self.pool.apply(_find_shortest_path, (node_a, node_b))
+
+
+class ServiceClient(object):
+
+    """Make requests to a service in the same process, without a server.
+
+    Bodies and responses are encoded to json and back, just like they would
+    travel through HTTP.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, path):
+        return self._request("GET", path)
+
+    def post(self, path, data):
+        return self._request("POST", path, json.dumps(data))
+
+    def _request(self, method, path, body=None):
+        status, response = self.service.handle(method, path, body)
+        return status, json.loads(json.dumps(response))
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Pass HTTP requests to the service of the server."""
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+
+        status, response = self.server.service.handle(self.command,
+                                                      self.path, body)
+        content = json.dumps(response).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+
+    """HTTP server answering each request in a new thread."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        BaseHTTPServer.HTTPServer.__init__(self, address, RequestHandler)
+        self.service = service
+
+
+def _init_worker(graph_file):
+    global _worker_graph
+    _worker_graph = shared_graph.SharedGraph(graph_file)
+
+
+def _has_node(node):
+    return node in _worker_graph
+
+
+def _find_shortest_path(node_a, node_b):
+    return _worker_graph.find_shortest_path(node_a, node_b)
+
+
+def _get_field(data, name, types):
+    """Get a field of a request, checking it is there and its type."""
+
+    if name not in data:
+        raise RequestError(400, "missing field {}".format(name))
+
+    value = data[name]
+    if not isinstance(value, types) or isinstance(value, bool):
+        raise RequestError(400, "field {} has an invalid type".format(name))
+
+    return value
+
+
+def _check_service(service):
+    """Check a service has the stations and dates to be geolocated."""
+    from modules.time_zones import parse_iso
+
+    if not isinstance(service, dict):
+        raise RequestError(400, "services must be json objects")
+
+    for field in SERVICE_FIELDS:
+        value = _get_field(service, field, basestring)
+        if field.endswith("_date"):
+            try:
+                parse_iso(value)
+            except ValueError:
+                raise RequestError(400, "field {} is not an ISO 8601 "
+                                   "date".format(field))
+
+
+def create_server(service, host="", port=DEFAULT_PORT):
+    """Create a threaded HTTP server for a service."""
+    return ThreadedHTTPServer((host, port), service)
+
+
+def main(port=DEFAULT_PORT):
+    service = AmtrakService()
+    service.start()
+
+    server = create_server(service, port=port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        main(int(sys.argv[1]))
+    else:
+        main()
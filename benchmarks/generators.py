@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+generators
+
+Synthesize inputs of any size for the benchmarks.
+
+Itineraries are written in the same format of the amtrak confirmation
+e-mails found in "trip.txt", using real station names, and rail graphs are
+either connected samples of the rail lines shapefile or random graphs.
+"""
+
+from __future__ import unicode_literals
+import datetime
+import random
+
+TRAINS = ["49 Lake Shore Ltd.", "5 California Zephyr", "712 San Joaquin",
+          "3 Southwest Chief", "7 Empire Builder", "11 Coast Starlight",
+          "3349 Thruway Bus"]
+ACCOMMODATIONS = ["1 Reserved Coach Seat", "1 Roomette", "1 Bedroom"]
+
+DATE_FORMAT = "%A %B %d, %Y         %I:%M%p"
+
+
+def load_station_names(shp_file="amtrk_sta/amtrk_sta"):
+    """List the names of the stations in the amtrak stations shapefile."""
+    import shapefile
+
+    return [record[1] for record in shapefile.Reader(shp_file).iterRecords()]
+
+
+def generate_itinerary(services_count, stations, seed=None):
+    """Generate the text of an itinerary with consecutive services.
+
+    Each service departs from the station where the previous one arrived,
+    some days later, just like a real trip.
+
+    Args:
+        services_count (int): Number of services in the itinerary.
+        stations (list): Station names to pick stations from.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        str: Text formated like an amtrak itinerary e-mail.
+    """
+
+    rand = random.Random(seed)
+    date = datetime.datetime(2015, 5, 18, 15, 40)
+    station = rand.choice(stations)
+
+    lines = ["THIS IS NOT A TICKET", ""]
+    for i in range(services_count):
+        arrival_station = rand.choice(stations)
+        arrival_date = date + datetime.timedelta(
+            minutes=rand.randint(30, 3000))
+
+        lines.extend([
+            "Train: " + rand.choice(TRAINS),
+            "Departure: " + station,
+            date.strftime(DATE_FORMAT),
+            "Arrival: " + arrival_station,
+            arrival_date.strftime(DATE_FORMAT),
+            "Accommodation: " + rand.choice(ACCOMMODATIONS),
+            ""])
+
+        station = arrival_station
+        date = arrival_date + datetime.timedelta(
+            minutes=rand.randint(60, 5000))
+
+    return "\n".join(lines) + "\n"
+
+
+def write_itinerary(file_name, services_count, stations, seed=None):
+    """Write a generated itinerary into a text file."""
+    with open(file_name, "wb") as f:
+        f.write(generate_itinerary(services_count, stations,
+                                   seed).encode("utf-8"))
+
+
+def load_rail_lines(lines_shp_file="rail/rail_lines"):
+    """Read the links of a rail lines shapefile.
+
+    Returns:
+        list: Tuples (from_node_id, to_node_id, miles).
+    """
+    from modules.mapped_shapefile import MappedShapefile
+
+    sf_lines = MappedShapefile(lines_shp_file)
+    miles, from_ids, to_ids = sf_lines.read_columns([1, 23, 24])
+    sf_lines.close()
+
+    return list(zip(from_ids.tolist(), to_ids.tolist(), miles.tolist()))
+
+
+def sample_rail_subgraph(lines, lines_count, seed=None):
+    """Sample a connected subgraph of the rail network.
+
+    Links are taken in breadth first order starting from a random node, so
+    the sample is a connected piece of the network and not scattered links.
+
+    Args:
+        lines (list): Tuples (from_node_id, to_node_id, miles) of the whole
+            network, as returned by `load_rail_lines`.
+        lines_count (int): Maximum number of links in the sample.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        list: Tuples (from_node_id, to_node_id, miles).
+    """
+
+    rand = random.Random(seed)
+
+    links = {}
+    for index, (from_id, to_id, miles) in enumerate(lines):
+        links.setdefault(from_id, []).append(index)
+        links.setdefault(to_id, []).append(index)
+
+    start = lines[rand.randrange(len(lines))][0]
+    visited_nodes, sampled = set([start]), set()
+    queue = [start]
+
+    while queue and len(sampled) < lines_count:
+        node = queue.pop(0)
+        for index in links[node]:
+            if index in sampled or len(sampled) >= lines_count:
+                continue
+            sampled.add(index)
+
+            for next_node in lines[index][:2]:
+                if next_node not in visited_nodes:
+                    visited_nodes.add(next_node)
+                    queue.append(next_node)
+
+    return [lines[index] for index in sorted(sampled)]
+
+
+def generate_random_graph(nodes_count, links_per_node=3, seed=None):
+    """Generate the links of a random connected graph.
+
+    Every node is linked to one of the previous nodes, which keeps the graph
+    connected, plus some other random links.
+
+    Returns:
+        list: Tuples (from_node_id, to_node_id, miles).
+    """
+
+    rand = random.Random(seed)
+
+    lines = []
+    for node in range(1, nodes_count):
+        lines.append((rand.randrange(node), node, rand.uniform(0.1, 10)))
+
+        for i in range(links_per_node - 1):
+            lines.append((node, rand.randrange(nodes_count),
+                          rand.uniform(0.1, 10)))
+
+    return lines
@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+profiling
+
+Profile the entry points of the pipeline on a synthetic itinerary.
+
+`amtrak.main` and `amtrak_geolocalize.main` are run in a scratch directory
+on a generated itinerary. Time zones come from a stub that guesses them from
+the longitude of each station, instead of the Google Time Zone API, so
+profiles don't depend on the network and can be reproduced.
+
+Every entry point is profiled three times, each time in a fresh child process
+so caches warmed by one run don't leak into the next:
+
+    <entry>.pstats             cProfile stats, to load with pstats
+    <entry>.txt                functions sorted by cumulative time
+    <entry>.collapsed          self time by call stack, in microseconds, in
+                               the collapsed stack format of flamegraph.pl
+    <entry>.speedscope.json    the same stacks for https://www.speedscope.app
+    <entry>.allocations.json   memory allocated by the entry point
+
+Allocations are taken by source line with tracemalloc where it is available.
+Python 2 has no tracemalloc, so there the growth of live objects by type and
+of the maximum resident set size is reported instead.
+
+Example:
+    $ python benchmarks/profiling.py
+    $ python benchmarks/profiling.py geolocalize --services 500
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+import argparse
+import collections
+import contextlib
+import cProfile
+import gc
+import io
+import json
+import multiprocessing
+import os
+import pstats
+import resource
+import shutil
+import sys
+import tempfile
+import timeit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import generators
+
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT_DIR, "profiles")
+DATA_DIRS = ["amtrk_sta", "rail"]
+OUTPUT_DIRS = ["json", "geojson", "topojson"]
+TOP_COUNT = 30
+
+# westernmost longitude of each time zone stubbed, from east to west
+STUB_TIME_ZONES = [(-85.5, "America/New_York"),
+                   (-101.0, "America/Chicago"),
+                   (-114.5, "America/Denver"),
+                   (-180.0, "America/Los_Angeles")]
+
+
+def stub_get_tz(coordinates, timestamp):
+    """Guess the time zone of a point from its longitude, without network."""
+
+    for west_longitude, tzid in STUB_TIME_ZONES:
+        if coordinates[0] >= west_longitude:
+            return tzid
+
+    return STUB_TIME_ZONES[-1][1]
+
+
+@contextlib.contextmanager
+def stubbed_time_zones():
+    """Use the stub time zones in `amtrak_geolocalize` while in the block."""
+    import amtrak_geolocalize
+
+    get_tz = amtrak_geolocalize._get_tz
+    amtrak_geolocalize._get_tz = stub_get_tz
+    try:
+        yield
+    finally:
+        amtrak_geolocalize._get_tz = get_tz
+
+
+def run_parse():
+    import amtrak
+    amtrak.main("trip.txt", "./json/amtrak-trip.json")
+
+
+def run_geolocalize():
+    import amtrak_geolocalize
+
+    with stubbed_time_zones():
+        amtrak_geolocalize.main()
+
+
+# entry points in the order they run, geolocalize reads what parse writes
+ENTRY_POINTS = collections.OrderedDict([("parse", run_parse),
+                                        ("geolocalize", run_geolocalize)])
+
+
+class StackProfiler(object):
+
+    """Trace every call and add up the self time of each call stack.
+
+    Attributes:
+        stacks (dict): Self time, in seconds, by call stack. Stacks are
+            tuples of frames (function, file, line) from the outermost call.
+    """
+
+    def __init__(self):
+        self.stacks = collections.defaultdict(float)
+        self._calls = []
+        self._timer = timeit.default_timer
+
+    def runcall(self, function, *args, **kwargs):
+        sys.setprofile(self._trace)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            sys.setprofile(None)
+
+    def _trace(self, frame, event, arg):
+        now = self._timer()
+
+        if event == "call":
+            code = frame.f_code
+            self._push((code.co_name, _relative_path(code.co_filename),
+                        code.co_firstlineno), now)
+        elif event == "c_call":
+            self._push((_c_function_name(arg), "", 0), now)
+
+        # returns from frames entered before tracing started are skipped
+        elif self._calls:
+            self._pop(now)
+
+    def _push(self, frame, now):
+        stack = self._calls[-1][0] + (frame,) if self._calls else (frame,)
+        self._calls.append([stack, now, 0.0])
+
+    def _pop(self, now):
+        stack, start, children_time = self._calls.pop()
+        elapsed = now - start
+        self.stacks[stack] += elapsed - children_time
+
+        if self._calls:
+            self._calls[-1][2] += elapsed
+
+
+def _relative_path(file_name):
+    if file_name.startswith(ROOT_DIR):
+        return os.path.relpath(file_name, ROOT_DIR)
+    return file_name
+
+
+def _c_function_name(function):
+    module = getattr(function, "__module__", None) or ""
+    name = getattr(function, "__name__", repr(function))
+    return "{}.{}".format(module, name) if module else name
+
+
+def _frame_name(frame):
+    function, file_name, line = frame
+    if not file_name:
+        return function
+    return "{} ({}:{})".format(function, file_name, line)
+
+
+def write_collapsed(stacks, file_name):
+    """Write stacks in the collapsed format, weighted in microseconds."""
+
+    with io.open(file_name, "w", encoding="utf-8") as f:
+        for stack, seconds in sorted(stacks.items()):
+            microseconds = int(round(seconds * 1e6))
+            if microseconds > 0:
+                f.write("{} {}\n".format(";".join(
+                    _frame_name(frame).replace(";", ",") for frame in stack),
+                    microseconds))
+
+
+def write_speedscope(stacks, name, file_name):
+    """Write stacks as a sampled profile in the speedscope file format."""
+
+    frames, indexes = [], {}
+    samples, weights = [], []
+    for stack, seconds in sorted(stacks.items()):
+        microseconds = int(round(seconds * 1e6))
+        if microseconds <= 0:
+            continue
+
+        sample = []
+        for frame in stack:
+            if frame not in indexes:
+                indexes[frame] = len(frames)
+                function, frame_file, line = frame
+                frames.append({"name": function, "file": frame_file,
+                               "line": line} if frame_file else
+                              {"name": function})
+            sample.append(indexes[frame])
+
+        samples.append(sample)
+        weights.append(microseconds)
+
+    speedscope = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "amtrak-trip benchmarks/profiling.py",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": [{"type": "sampled", "name": name,
+                      "unit": "microseconds", "startValue": 0,
+                      "endValue": sum(weights), "samples": samples,
+                      "weights": weights}]}
+
+    with open(file_name, "w") as f:
+        f.write(json.dumps(speedscope))
+
+
+def profile_time(entry, output_dir):
+    """Profile an entry point with cProfile."""
+
+    profiler = cProfile.Profile()
+    profiler.runcall(ENTRY_POINTS[entry])
+
+    file_name = os.path.join(output_dir, entry)
+    profiler.dump_stats(file_name + ".pstats")
+
+    with open(file_name + ".txt", "w") as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats("cumulative").print_stats(TOP_COUNT)
+
+    return {"total_sec": round(stats.total_tt, 4)}
+
+
+def profile_stacks(entry, output_dir):
+    """Profile an entry point tracing its call stacks."""
+
+    profiler = StackProfiler()
+    profiler.runcall(ENTRY_POINTS[entry])
+
+    file_name = os.path.join(output_dir, entry)
+    write_collapsed(profiler.stacks, file_name + ".collapsed")
+    write_speedscope(profiler.stacks, entry, file_name + ".speedscope.json")
+
+    return {"stacks": len(profiler.stacks)}
+
+
+def profile_allocations(entry, output_dir):
+    """Measure the memory an entry point allocates.
+
+    Uses tracemalloc if it is available, otherwise counts live objects by
+    type before and after running the entry point.
+    """
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    gc.collect()
+    objects_before = _count_objects()
+    max_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if tracemalloc:
+        tracemalloc.start(25)
+
+    ENTRY_POINTS[entry]()
+
+    allocations = {"entry": entry}
+    if tracemalloc:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocations["tracemalloc"] = [
+            {"file": _relative_path(stat.traceback[0].filename),
+             "line": stat.traceback[0].lineno, "size_kb": stat.size // 1024,
+             "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:TOP_COUNT]]
+
+    gc.collect()
+    objects_after = _count_objects()
+    growth = {name: objects_after[name] - objects_before.get(name, 0)
+              for name in objects_after}
+    allocations["objects_growth"] = collections.OrderedDict(
+        sorted([(name, count) for name, count in growth.items() if count],
+               key=lambda item: -item[1])[:TOP_COUNT])
+    allocations["max_rss_growth_kb"] = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss - max_rss_before
+
+    with open(os.path.join(output_dir, entry + ".allocations.json"),
+              "w") as f:
+        f.write(json.dumps(allocations, indent=4))
+
+    return {"max_rss_growth_kb": allocations["max_rss_growth_kb"]}
+
+
+def _count_objects():
+    counts = collections.Counter(type(obj).__name__ for obj
+                                 in gc.get_objects())
+    return dict(counts)
+
+
+PROFILERS = [profile_time, profile_stacks, profile_allocations]
+
+
+def prepare_work_dir(work_dir, services_count, seed=None):
+    """Set up a directory to run the entry points in.
+
+    Data directories are linked from the repository, outputs are written
+    inside the directory, and a generated itinerary is saved as trip.txt.
+    """
+
+    for data_dir in DATA_DIRS:
+        os.symlink(os.path.join(ROOT_DIR, data_dir),
+                   os.path.join(work_dir, data_dir))
+    for output_dir in OUTPUT_DIRS:
+        os.makedirs(os.path.join(work_dir, output_dir))
+
+    stations = generators.load_station_names(
+        os.path.join(ROOT_DIR, "amtrk_sta", "amtrk_sta"))
+    generators.write_itinerary(os.path.join(work_dir, "trip.txt"),
+                               services_count, stations, seed)
+
+
+def run_profile(entries, services_count=200, seed=1,
+                output_dir=DEFAULT_OUTPUT_DIR):
+    """Profile entry points of the pipeline and write profiles.
+
+    Args:
+        entries (list): Names of entry points to profile, they run in the
+            order of ENTRY_POINTS.
+        services_count (int): Number of services of the itinerary.
+        seed (int): Seed of the generated itinerary.
+        output_dir (str): Directory to write profiles into.
+
+    Returns:
+        dict: Results of every profiler, by entry point.
+    """
+
+    output_dir = os.path.abspath(output_dir)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        prepare_work_dir(work_dir, services_count, seed)
+
+        results = collections.OrderedDict()
+        for entry in ENTRY_POINTS:
+            if entry not in entries and entry != "parse":
+                continue
+
+            results[entry] = {}
+            for profiler in PROFILERS:
+                results[entry].update(_run_in_child(profiler, entry,
+                                                    work_dir, output_dir))
+
+            # parse always runs, to write the input of the other entries
+            if entry not in entries:
+                del results[entry]
+    finally:
+        shutil.rmtree(work_dir)
+
+    return results
+
+
+def _run_in_child(profiler, entry, work_dir, output_dir):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_profile_child, args=(profiler, entry, work_dir, output_dir,
+                                     queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    if "error" in result:
+        raise RuntimeError("profiling {} failed: {}".format(entry,
+                                                             result["error"]))
+    return result
+
+
+def _profile_child(profiler, entry, work_dir, output_dir, queue):
+    try:
+        os.chdir(work_dir)
+        queue.put(profiler(entry, output_dir))
+    except Exception as e:
+        queue.put({"error": repr(e)})
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Profile the pipeline.")
+    parser.add_argument("entries", nargs="*",
+                        help="entry points to profile, of {} (default "
+                        "all)".format(", ".join(ENTRY_POINTS)))
+    parser.add_argument("--services", type=int, default=200,
+                        help="number of services of the itinerary")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    args = parser.parse_args(args)
+
+    for entry in args.entries:
+        if entry not in ENTRY_POINTS:
+            parser.error("unknown entry point {}".format(entry))
+
+    results = run_profile(args.entries or list(ENTRY_POINTS), args.services,
+                          args.seed, args.output_dir)
+    for entry, result in results.items():
+        print("{:<16} {}".format(entry, ", ".join(
+            "{} {}".format(name, value) for name, value
+            in sorted(result.items()))))
+    print("profiles written to {}".format(os.path.abspath(args.output_dir)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+run
+
+Run the benchmark suite and compare results against a stored baseline.
+
+Measures parser throughput, station resolution throughput (with and without
+a compiled gazetteer), rail graph build time and memory, shortest path query
+latencies and module import times, using synthetic inputs from
+`generators`. Results are compared with `benchmarks/baseline.json` and any
+measure worse than the baseline by more than the tolerance is reported as a
+regression (and the exit code is 1).
+
+Example:
+    $ python benchmarks/run.py
+    $ python benchmarks/run.py --save
+    $ python benchmarks/run.py --lines rail/rail_lines \
+        --baseline benchmarks/baseline-rail-lines.json
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import generators
+import startup
+
+BASELINE_FILE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+TOLERANCE = 0.2
+
+# differences smaller than these are noise, by unit of the measure
+NOISE = {"_ms": 2.0, "_sec": 0.002, "_kb": 1024}
+
+# measures where a bigger value is better, all the others are times
+HIGHER_IS_BETTER = ["parser_lines_per_sec", "stations_shapefile_per_sec",
+                    "stations_gazetteer_per_sec"]
+
+
+def bench_parser(stations, services_count=500, seed=1):
+    """Parse a generated itinerary and measure lines parsed per second."""
+    import amtrak
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        file_name = os.path.join(temp_dir, "trip.txt")
+        generators.write_itinerary(file_name, services_count, stations, seed)
+        with open(file_name) as f:
+            lines_count = len(f.readlines())
+
+        start = time.time()
+        services = list(amtrak.parse_services(file_name))
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(temp_dir)
+
+    assert len(services) == services_count
+    return {"parser_lines_per_sec": round(lines_count / elapsed, 1)}
+
+
+def bench_station_resolution(stations, stations_count=1000,
+                             shapefile_stations_count=5, seed=1):
+    """Find coordinates of random stations and measure stations per second.
+
+    Stations are looked up in a copy of the stations shapefile, without
+    and then with a compiled gazetteer next to it, so the measures don't
+    depend on a gazetteer being built in the working tree.
+    """
+    import amtrak_geolocalize
+    from modules import gazetteer
+
+    rand = random.Random(seed)
+    sample = [rand.choice(stations) for i in range(stations_count)]
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        shp_file = os.path.join(temp_dir, "amtrk_sta")
+        for extension in ["shp", "shx", "dbf"]:
+            shutil.copy(os.path.join(ROOT_DIR, "amtrk_sta",
+                                     "amtrk_sta." + extension),
+                        "{}.{}".format(shp_file, extension))
+
+        results = {"stations_shapefile_per_sec": _measure_stations(
+            sample[:shapefile_stations_count], shp_file)}
+
+        gazetteer.build_gazetteer(shp_file, shp_file + ".gaz",
+                                  nodes_shp_file=None)
+        results["stations_gazetteer_per_sec"] = _measure_stations(
+            sample, shp_file)
+        amtrak_geolocalize._gazetteers.pop(shp_file + ".gaz")[1].close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return results
+
+
+def _measure_stations(sample, shp_file):
+    import amtrak_geolocalize
+
+    start = time.time()
+    for station in sample:
+        amtrak_geolocalize.find_coordinates(station, shp_file)
+    elapsed = time.time() - start
+
+    return round(len(sample) / elapsed, 1)
+
+
+def bench_graph_build(lines):
+    """Build a graph from a list of links measuring time and memory.
+
+    The graph is built in a child process so the memory it takes can be
+    measured as the growth of the child's resident set size.
+    """
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_build_graph,
+                                      args=(lines, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    return result
+
+
+def _build_graph(lines, queue):
+    from modules.graph import Graph
+
+    rss_before = _get_rss_kb()
+    start = time.time()
+
+    graph = Graph()
+    for from_id, to_id, miles in lines:
+        graph.add_edge(from_id, to_id, miles)
+        graph.add_edge(to_id, from_id, miles)
+
+    elapsed = time.time() - start
+    rss_after = _get_rss_kb()
+
+    queue.put({"graph_build_sec": round(elapsed, 4),
+               "graph_build_rss_kb": rss_after - rss_before})
+
+
+def _get_rss_kb():
+    """Current resident set size of the process, in kilobytes.
+
+    Falls back to the maximum resident set size where /proc is not
+    available.
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_shortest_path(lines, queries_count=20, seed=1):
+    """Measure latency percentiles of shortest path queries."""
+    from modules.graph import Graph
+
+    graph = Graph()
+    for from_id, to_id, miles in lines:
+        graph.add_edge(from_id, to_id, miles)
+        graph.add_edge(to_id, from_id, miles)
+
+    rand = random.Random(seed)
+    nodes = sorted(graph)
+    latencies = []
+    for i in range(queries_count):
+        node_a, node_b = rand.choice(nodes), rand.choice(nodes)
+
+        start = time.time()
+        try:
+            graph.find_shortest_path(node_a, node_b)
+        except KeyError:
+            # nodes not connected in the sampled graph
+            continue
+        latencies.append(time.time() - start)
+
+    return {"shortest_path_p{}_sec".format(percentile):
+            round(_percentile(latencies, percentile), 4)
+            for percentile in [50, 90, 99]}
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = int(round(percentile / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def run_benchmarks(lines_shp_file=None, lines_count=1000,
+                   build_lines_count=50000, seed=1):
+    """Run all the benchmarks.
+
+    Args:
+        lines_shp_file (str): Rail lines shapefile to sample graphs from. A
+            random graph is used if it is None.
+        lines_count (int): Number of links of the graph used for shortest
+            path queries.
+        build_lines_count (int): Number of links of the graph used to
+            measure build time and memory.
+        seed (int): Seed of the random generators.
+
+    Returns:
+        dict: Name and value of every measure.
+    """
+
+    stations = generators.load_station_names(
+        os.path.join(ROOT_DIR, "amtrk_sta", "amtrk_sta"))
+
+    if lines_shp_file:
+        all_lines = generators.load_rail_lines(lines_shp_file)
+        build_lines = generators.sample_rail_subgraph(
+            all_lines, build_lines_count, seed)
+        lines = generators.sample_rail_subgraph(all_lines, lines_count, seed)
+    else:
+        build_lines = generators.generate_random_graph(
+            build_lines_count // 3, seed=seed)
+        lines = generators.generate_random_graph(lines_count // 3, seed=seed)
+
+    results = {}
+    results.update(bench_parser(stations, seed=seed))
+    results.update(bench_station_resolution(stations, seed=seed))
+    results.update(bench_graph_build(build_lines))
+    results.update(bench_shortest_path(lines, seed=seed))
+    results.update(startup.measure_startup())
+
+    return results
+
+
+def find_regressions(results, baseline, tolerance=TOLERANCE):
+    """Compare results with a baseline.
+
+    Returns:
+        list: Names of the measures worse than the baseline by more than the
+            tolerance.
+    """
+
+    regressions = []
+    for name, value in sorted(results.items()):
+        if not baseline.get(name):
+            continue
+
+        if name in HIGHER_IS_BETTER:
+            worse = value < baseline[name] * (1 - tolerance)
+        else:
+            noise = [NOISE[unit] for unit in NOISE if name.endswith(unit)]
+            worse = value > baseline[name] * (1 + tolerance) and \
+                value - baseline[name] > sum(noise)
+
+        if worse:
+            regressions.append(name)
+
+    return regressions
+
+
+def load_baseline(file_name=BASELINE_FILE):
+    if not os.path.exists(file_name):
+        return {}
+
+    with open(file_name) as f:
+        return json.loads(f.read())
+
+
+def write_baseline(results, file_name=BASELINE_FILE):
+    with open(file_name, "w") as f:
+        f.write(json.dumps(results, indent=4, sort_keys=True))
+
+
+def print_results(results, baseline):
+    """Print results next to the baseline, marking regressions.
+
+    Returns:
+        list: Names of the measures that regressed.
+    """
+
+    regressions = find_regressions(results, baseline)
+    for name in sorted(results):
+        line = "{:<32} {:>12}".format(name, results[name])
+        if name in baseline:
+            line += "   (baseline {})".format(baseline[name])
+        if name in regressions:
+            line += "   REGRESSION"
+        print(line)
+
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run benchmarks.")
+    parser.add_argument("--save", action="store_true",
+                        help="save results as the new baseline")
+    parser.add_argument("--lines", default=None,
+                        help="rail lines shapefile to sample graphs from")
+    parser.add_argument("--lines-count", type=int, default=1000)
+    parser.add_argument("--build-lines-count", type=int, default=50000)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args(args)
+
+    os.chdir(ROOT_DIR)
+    results = run_benchmarks(args.lines, args.lines_count,
+                             args.build_lines_count)
+
+    baseline = load_baseline(args.baseline)
+    regressions = print_results(results, baseline)
+
+    if args.save:
+        write_baseline(results, args.baseline)
+
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+startup
+
+Measure how long it takes to import each module of the project.
+
+Every module is imported in a fresh interpreter, several times, and the
+median import time is kept. Import times are part of the benchmark suite
+(see `run.py`) and share its baseline, `benchmarks/baseline.json`, and its
+regression check. This script only measures and checks import times, and
+exits with code 1 if any of them regressed.
+
+Example:
+    $ python benchmarks/startup.py
+    $ python benchmarks/startup.py --save
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULES = ["amtrak", "amtrak_geolocalize", "modules.parsers",
+           "modules.gazetteer", "modules.graph"]
+
+IMPORT_SCRIPT = ("import time; start = time.time(); import {}; "
+                 "print(time.time() - start)")
+
+
+def measure_import_time(module, repeat=5):
+    """Median time, in milliseconds, of importing a module in a new process.
+
+    Args:
+        module (str): Dotted name of the module, importable from the root of
+            the repo.
+        repeat (int): Number of fresh interpreters to import the module in.
+    """
+
+    times = []
+    for i in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(module)],
+            cwd=ROOT_DIR)
+        times.append(float(output.strip()) * 1000)
+
+    return round(sorted(times)[len(times) // 2], 2)
+
+
+def measure_startup(modules=MODULES, repeat=5):
+    """Measure import times of all modules.
+
+    Returns:
+        dict: Milliseconds taken by the import of each module, by measure
+            name "import_<module>_ms".
+    """
+    return {"import_{}_ms".format(module): measure_import_time(module, repeat)
+            for module in modules}
+
+
+def main(save=False):
+    import run
+
+    results = measure_startup()
+    baseline = run.load_baseline()
+
+    regressions = run.print_results(results, baseline)
+
+    if save:
+        baseline.update(results)
+        run.write_baseline(baseline)
+
+    return 1 if regressions and not save else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(save="--save" in sys.argv))
@@ -1,4 +1,5 @@
-import time
+import heapq
+import metrics
 
 
 def dijkstra(graph, node_a, node_z):
@@ -13,8 +14,6 @@ def dijkstra(graph, node_a, node_z):
         node_a: Node of origin.
         node_z: Node of destination.
     """
-    start = time.time()
-
     # check nodes are in graph
     assert node_a in graph
     assert node_z in graph
@@ -51,11 +50,6 @@ def dijkstra(graph, node_a, node_z):
         # remove selected node from the set
         nodes_set.discard(node)
         i += 1
-        elapsed = time.time() - start
-        average = elapsed / i
-        prediction = average * len(nodes_set) / 60 / 60
-
-        print "checking node number", i, "from", len(graph), "left", len(nodes_set), "prediction in hours", prediction
 
         # iterate through vertices of the selected node
         for vertix, weight in graph[node]:
@@ -72,6 +66,8 @@ def dijkstra(graph, node_a, node_z):
                     # update the previous_vertix to be the new closer node
                     previous_vertix[vertix] = node
 
+    metrics.incr("dijkstra_nodes_settled", i)
+
     # reconstruct the path found creating a list of nodes
     path_to_z = []
     node = node_z
@@ -85,3 +81,62 @@ def dijkstra(graph, node_a, node_z):
     distance_to_z = node_distances[node_z]
 
     return distance_to_z, path_to_z
+
+
+def dijkstra_tree(graph, node_a, nodes_z=None):
+    """
+    Single source dijkstra shortest paths using a heap.
+
+    Grow the tree of shortest paths from vertex 'a' until every node in
+    'nodes_z' is reached, so paths to many destinations sharing the same
+    origin are found in one search.
+
+    Args:
+        graph: Dictionary-like Graph with all the nodes and its weighted links.
+        node_a: Node of origin.
+        nodes_z: Nodes of destination. The whole graph is searched if it is
+            None.
+
+    Returns:
+        tuple: Dictionaries with the distance to node_a and the previous
+            vertix of every node reached.
+    """
+
+    assert node_a in graph
+
+    pending = set(nodes_z) if nodes_z is not None else None
+    node_distances, previous_vertix = {}, {}
+
+    heap = [(0.0, node_a, None)]
+    while heap:
+        distance, node, previous = heapq.heappop(heap)
+        if node in node_distances:
+            continue
+
+        node_distances[node] = distance
+        if previous is not None:
+            previous_vertix[node] = previous
+
+        if pending is not None:
+            pending.discard(node)
+            if not pending:
+                break
+
+        for vertix, weight in graph[node]:
+            if vertix not in node_distances:
+                heapq.heappush(heap, (distance + weight, vertix, node))
+
+    metrics.incr("dijkstra_nodes_settled", len(node_distances))
+
+    return node_distances, previous_vertix
+
+
+def reconstruct_path(previous_vertix, node_a, node_z):
+    """Create the list of nodes going from node_a to node_z."""
+
+    path_to_z = [node_z]
+    while path_to_z[-1] != node_a:
+        path_to_z.append(previous_vertix[path_to_z[-1]])
+    path_to_z.reverse()
+
+    return path_to_z
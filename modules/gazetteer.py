@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+gazetteer
+
+Compile the amtrak stations shapefile into a compact gazetteer file.
+
+Reading the stations shapefile with pyshp means parsing the whole .dbf and
+.shp files every time a station is looked up. The gazetteer is built once
+from the shapefile and stored as fixed size binary records, so it can be
+memory-mapped and opened almost instantly by short lived processes.
+
+Each record holds the station code, name, normalized name, state,
+coordinates, the id of the nearest node of the rail network and the time
+zone of the station.
+
+Time zones are retrieved from the Google Time Zone API when the gazetteer is
+built from the command line with the GOOGLE_API_KEY environment variable set.
+
+Example:
+    $ python modules/gazetteer.py
+    $ python modules/gazetteer.py amtrk_sta/amtrk_sta amtrk_sta/amtrk_sta.gaz
+
+    from modules import gazetteer
+    stations = gazetteer.Gazetteer("amtrk_sta/amtrk_sta.gaz")
+    stations.find("New York (Penn Station), New York")
+"""
+
+from __future__ import unicode_literals
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+
+MAGIC = b"AMGZ"
+VERSION = 1
+HEADER = struct.Struct(b"<4sHHI")
+RECORD = struct.Struct(b"<10s50s50s5s40sddi")
+NO_NODE = -1
+
+
+class Gazetteer(object):
+
+    """Read only access to a compiled gazetteer file.
+
+    The file is memory-mapped when the gazetteer is created and records are
+    only decoded when they are asked for.
+
+    Attributes:
+        file_name (str): Path of the gazetteer file.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+        with open(file_name, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, record_size, self._count = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or \
+                record_size != RECORD.size:
+            raise ValueError("{} is not a valid gazetteer file".format(
+                file_name))
+
+        self._names = None
+        self._normalized_names = None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self.record(index)
+
+    def record(self, index):
+        """Decode the record of a station.
+
+        Args:
+            index (int): Position of the station in the gazetteer.
+
+        Returns:
+            dict: Data of the station.
+
+            Example:
+                {"code": "NYP",
+                 "name": "New York (Penn Station), New York",
+                 "normalized_name": "new york penn station new york",
+                 "state": "NY",
+                 "timezone": "America/New_York",
+                 "coordinates": [-73.991867, 40.74968],
+                 "node_id": 123456}
+        """
+
+        if not 0 <= index < self._count:
+            raise IndexError("gazetteer index out of range")
+
+        code, name, normalized_name, state, timezone, lon, lat, node_id = \
+            RECORD.unpack_from(self._mmap, HEADER.size + index * RECORD.size)
+
+        return {"code": _decode(code),
+                "name": _decode(name),
+                "normalized_name": _decode(normalized_name),
+                "state": _decode(state),
+                "timezone": _decode(timezone),
+                "coordinates": [lon, lat],
+                "node_id": node_id if node_id != NO_NODE else None}
+
+    def names(self):
+        """List the names of all the stations, in gazetteer order."""
+
+        if self._names is None:
+            self._names = [self.record(index)["name"] for index
+                           in range(self._count)]
+
+        return self._names
+
+    def find(self, station):
+        """Find the record of the station best matching a name.
+
+        An exact match of normalized names is tried first, falling back to
+        fuzzy matching of the station name against all station names.
+
+        Args:
+            station (str): Amtrak station.
+
+        Returns:
+            dict: Data of the station, as returned by `record`.
+        """
+
+        if self._normalized_names is None:
+            self._normalized_names = {}
+            for index in range(self._count):
+                normalized_name = self.record(index)["normalized_name"]
+                self._normalized_names.setdefault(normalized_name, index)
+
+        index = self._normalized_names.get(normalize_name(station))
+        if index is None:
+            from fuzzywuzzy import process
+
+            names = self.names()
+            index = names.index(process.extractOne(station, names)[0])
+
+        return self.record(index)
+
+    def close(self):
+        self._mmap.close()
+
+
+def normalize_name(name):
+    """Lowercase a station name and leave only words separated by spaces."""
+    if isinstance(name, bytes):
+        name = name.decode("utf-8", "replace")
+    return " ".join(re.split(r"\W+", name.lower(), flags=re.UNICODE)).strip()
+
+
+def build_gazetteer(shp_file="amtrk_sta/amtrk_sta",
+                    file_name="amtrk_sta/amtrk_sta.gaz",
+                    nodes_shp_file="rail/rail_nodes", tz_lookup=None):
+    """Compile a shapefile of amtrak stations into a gazetteer file.
+
+    The gazetteer is written into a temporary file next to it and then
+    renamed, so processes that already opened an older version of the file
+    keep reading it untouched.
+
+    Args:
+        shp_file (str): Path to a shapefile of amtrak stations.
+        file_name (str): Path of the gazetteer file to write.
+        nodes_shp_file (str): Path to the rail_nodes shapefile used to find
+            the nearest rail node of each station (see `snapping`). Nodes are
+            not searched if it is None.
+        tz_lookup (callable): Takes coordinates [lon, lat] and returns a
+            time zone id. Time zones are left empty if it is None.
+
+    Returns:
+        int: Number of stations written.
+    """
+
+    import shapefile
+
+    sf = shapefile.Reader(shp_file)
+    records = sf.records()
+    coordinates = [shape.points[0] for shape in sf.shapes()]
+
+    if nodes_shp_file:
+        from snapping import NodeIndex
+
+        node_ids = [node_id if node_id >= 0 else NO_NODE for node_id in
+                    NodeIndex.from_shapefile(nodes_shp_file).snap(
+                        coordinates)[0].tolist()]
+    else:
+        node_ids = [NO_NODE] * len(coordinates)
+
+    directory, base_name = os.path.split(os.path.abspath(file_name))
+    fd, temp_file_name = tempfile.mkstemp(prefix=base_name + ".",
+                                          dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(records)))
+
+            for record, coord, node_id in zip(records, coordinates,
+                                              node_ids):
+                timezone = tz_lookup(coord) if tz_lookup else ""
+                f.write(RECORD.pack(_encode(record[0]), _encode(record[1]),
+                                    _encode(normalize_name(record[1])),
+                                    _encode(record[5]), _encode(timezone),
+                                    coord[0], coord[1], node_id))
+        # temporary files are only readable by their owner
+        os.chmod(temp_file_name, 0o644)
+        os.rename(temp_file_name, file_name)
+    except Exception:
+        os.remove(temp_file_name)
+        raise
+
+    return len(records)
+
+
+def _encode(value):
+    if not isinstance(value, bytes):
+        value = value.encode("utf-8")
+    return value
+
+
+def _decode(value):
+    return value.rstrip(b"\x00 ").decode("utf-8")
+
+
+def get_default_tz_lookup():
+    """Time zone lookup used when building from the command line.
+
+    Time zones are taken from the Google Time Zone API when the
+    GOOGLE_API_KEY environment variable is set, and left empty otherwise.
+    """
+
+    if not os.environ.get("GOOGLE_API_KEY"):
+        return None
+
+    from time_zones import google_time_zone
+    return google_time_zone
+
+
+if __name__ == '__main__':
+    tz_lookup = get_default_tz_lookup()
+    if len(sys.argv) == 2:
+        build_gazetteer(sys.argv[1], tz_lookup=tz_lookup)
+    elif len(sys.argv) == 3:
+        build_gazetteer(sys.argv[1], sys.argv[2], tz_lookup=tz_lookup)
+    else:
+        build_gazetteer(tz_lookup=tz_lookup)
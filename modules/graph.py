@@ -8,8 +8,9 @@ Build a graph that can be used by the dijkstra module.
 """
 
 from __future__ import unicode_literals
-import shapefile
-from dijkstra import dijkstra
+import os
+from dijkstra import dijkstra, dijkstra_tree, reconstruct_path
+import metrics
 
 
 class Graph(dict):
@@ -45,26 +46,71 @@ class Graph(dict):
         if weighted_edge not in self[node_a]:
             self[node_a].append(weighted_edge)
 
+    @metrics.timed("shortest_path")
     def find_shortest_path(self, node_a, node_b):
         """Find shortest path between a and b nodes."""
         distance, path = dijkstra(self, node_a, node_b)
         return distance, path
 
+    @metrics.timed("shortest_paths")
+    def find_shortest_paths(self, node_a, nodes_b):
+        """Find shortest paths from node a to many nodes in one search.
+
+        Returns:
+            dict: Tuples (distance, path) by node b, for every node of nodes_b
+                that can be reached from node a.
+        """
+
+        for node_b in nodes_b:
+            assert node_b in self
+
+        distances, previous = dijkstra_tree(self, node_a, nodes_b)
+
+        return {node_b: (distances[node_b],
+                         reconstruct_path(previous, node_a, node_b))
+                for node_b in nodes_b if node_b in distances}
+
+
+@metrics.timed("graph_build")
+def build_amtrak_rail_graph(lines_shp_file="rail/rail_lines"):
+    from mapped_shapefile import MappedShapefile
 
-def build_amtrak_rail_graph():
     graph = Graph()
 
-    sf_lines = shapefile.Reader("rail/rail_lines")
-    for record in sf_lines.iterRecords():
-        from_id, to_id, miles = record[23], record[24], record[1]
-        graph.add_edge(from_id, to_id, miles)
-        graph.add_edge(to_id, from_id, miles)
+    # only MILES, FRFRANODE and TOFRANODE columns are decoded
+    sf_lines = MappedShapefile(lines_shp_file)
+    miles, from_ids, to_ids = sf_lines.read_columns([1, 23, 24])
+    sf_lines.close()
+
+    for from_id, to_id, weight in zip(from_ids.tolist(), to_ids.tolist(),
+                                      miles.tolist()):
+        graph.add_edge(from_id, to_id, weight)
+        graph.add_edge(to_id, from_id, weight)
+    metrics.incr("graph_lines", len(miles))
 
     return graph
 
 
-def get_amtrak_rail_graph():
-    """
-    TODO: should save graph when build to retrieve it when already built.
+def get_amtrak_rail_graph(lines_shp_file="rail/rail_lines", graph_file=None):
+    """Get the rail graph, building it only if it wasn't already built.
+
+    The graph is saved next to the rail_lines shapefile in the shared graph
+    format, so processes can map it into memory instead of rebuilding it,
+    all of them using the same copy.
+
+    Args:
+        lines_shp_file (str): Path to the rail_lines shapefile.
+        graph_file (str): Path of the shared graph file. Uses the path of
+            the shapefile with a .graph extension if it is None.
+
+    Returns:
+        SharedGraph: Read only rail graph.
     """
-    return build_amtrak_rail_graph()
+    from shared_graph import SharedGraph, publish_graph
+
+    graph_file = graph_file or lines_shp_file + ".graph"
+    if not os.path.exists(graph_file) or os.path.getmtime(graph_file) < \
+            os.path.getmtime(lines_shp_file + ".dbf"):
+        publish_graph(build_amtrak_rail_graph(lines_shp_file), graph_file)
+
+    return SharedGraph(graph_file)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+mapped_shapefile
+
+Read columns and points of big shapefiles straight into numpy arrays.
+
+pyshp decodes every field of every record into python strings, ints and
+floats, even when only a few fields are needed. Here the .dbf, .shp and .shx
+files are memory-mapped and only the requested columns are decoded, using the
+fixed size of .dbf records, and shapes are located through the offsets of the
+.shx index instead of reading the .shp file sequentially.
+
+Columns are referenced by name or by position, counting positions like pyshp
+does in a record (the deletion flag is not a column).
+
+Example:
+    from modules.mapped_shapefile import MappedShapefile
+    sf_lines = MappedShapefile("rail/rail_lines")
+    miles, from_ids, to_ids = sf_lines.read_columns([1, 23, 24])
+"""
+
+from __future__ import unicode_literals
+import mmap
+import struct
+import numpy as np
+
+DBF_HEADER = struct.Struct(b"<BBBBIHH")
+DBF_FIELD = struct.Struct(b"<11sc4xBB14x")
+DBF_FIELDS_END = b"\r"
+
+SHP_HEADER_SIZE = 100
+SHP_RECORD_HEADER_SIZE = 8
+
+NULL_SHAPE = 0
+POINT = 1
+
+
+class MappedShapefile(object):
+
+    """Memory-mapped shapefile.
+
+    Attributes:
+        shp_file (str): Path of the shapefile, without extension.
+        fields (list): Tuples (name, type, length, decimals) of the columns.
+        num_records (int): Number of records.
+    """
+
+    def __init__(self, shp_file):
+        self.shp_file = shp_file
+        self._maps = {}
+        self._offsets = None
+
+        dbf = self._get_map("dbf")
+        version, year, month, day, self.num_records, self._header_length, \
+            self._record_length = DBF_HEADER.unpack_from(dbf, 0)
+
+        self.fields = []
+        position = 32
+        while dbf[position:position + 1] != DBF_FIELDS_END:
+            name, field_type, length, decimals = \
+                DBF_FIELD.unpack_from(dbf, position)
+            self.fields.append((name.split(b"\x00")[0].decode("ascii"),
+                                field_type.decode("ascii"), length,
+                                decimals))
+            position += DBF_FIELD.size
+
+    def read_columns(self, columns):
+        """Decode some columns of all records.
+
+        Args:
+            columns (list): Names or positions of the columns.
+
+        Returns:
+            list: One array for each column. Numeric columns ("N" and "F")
+                are decoded to int64 or float64 (blank values are 0), other
+                columns are byte strings.
+        """
+
+        rows = np.frombuffer(self._get_map("dbf"), np.uint8,
+                             self.num_records * self._record_length,
+                             self._header_length).reshape(
+            self.num_records, self._record_length)
+
+        return [self._decode_column(rows, self._get_field_index(column))
+                for column in columns]
+
+    def read_points(self):
+        """Read the first point of every shape.
+
+        Only the bytes of the coordinates are copied out of the .shp file,
+        picked at the offsets of the .shx index.
+
+        Returns:
+            numpy.ndarray: Array of shape (num_records, 2) with [x, y] of each
+                shape. Null shapes are [nan, nan].
+        """
+
+        offsets = self._get_offsets() + SHP_RECORD_HEADER_SIZE
+        shp = np.frombuffer(self._get_map("shp"), np.uint8)
+
+        shape_types = self._gather_ints(shp, offsets)
+        null_shapes = shape_types == NULL_SHAPE
+        points = shape_types == POINT
+
+        # points of other shapes come after their bounding box, the counts of
+        # parts and points and the index of each part
+        points_offsets = offsets + 4
+        others = ~(null_shapes | points)
+        points_offsets[others] += 40 + 4 * self._gather_ints(
+            shp, offsets[others] + 36)
+        points_offsets[null_shapes] = 0
+
+        coordinates = shp[points_offsets[:, np.newaxis] +
+                          np.arange(16)].copy().view(b"<f8")
+        coordinates[null_shapes] = np.nan
+
+        return coordinates
+
+    def shape_points(self, index):
+        """Read the points of one shape, located through the .shx index.
+
+        Returns:
+            list: Points [x, y] of the shape.
+        """
+
+        if not 0 <= index < self.num_records:
+            raise IndexError("shape index out of range")
+
+        shp = self._get_map("shp")
+        position = int(self._get_offsets()[index]) + SHP_RECORD_HEADER_SIZE
+
+        shape_type = struct.unpack_from(b"<i", shp, position)[0]
+        if shape_type == NULL_SHAPE:
+            return []
+        elif shape_type == POINT:
+            return [list(struct.unpack_from(b"<2d", shp, position + 4))]
+
+        num_parts, num_points = struct.unpack_from(b"<2i", shp,
+                                                   position + 36)
+        points_position = position + 44 + 4 * num_parts
+        points = np.frombuffer(shp, b"<f8", num_points * 2, points_position)
+
+        return points.reshape(num_points, 2).tolist()
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+
+    def _get_offsets(self):
+        """Byte offsets of every record in the .shp file."""
+
+        if self._offsets is None:
+            shx = np.frombuffer(self._get_map("shx"), b">i4",
+                                self.num_records * 2, SHP_HEADER_SIZE)
+            # offsets are stored in 16 bit words
+            self._offsets = shx[0::2].astype(np.int64) * 2
+
+        return self._offsets
+
+    @staticmethod
+    def _gather_ints(shp, offsets):
+        """Read little endian int32 values at some offsets of the .shp file.
+        """
+        return shp[offsets[:, np.newaxis] +
+                   np.arange(4)].copy().view(b"<i4").ravel()
+
+    def _get_map(self, extension):
+        if extension not in self._maps:
+            with open("{}.{}".format(self.shp_file, extension), "rb") as f:
+                self._maps[extension] = mmap.mmap(f.fileno(), 0,
+                                                  access=mmap.ACCESS_READ)
+
+        return self._maps[extension]
+
+    def _get_field_index(self, column):
+        if isinstance(column, int):
+            return column
+
+        names = [field[0] for field in self.fields]
+        return names.index(column)
+
+    def _decode_column(self, rows, field_index):
+        name, field_type, length, decimals = self.fields[field_index]
+
+        # first byte of every record is the deletion flag
+        start = 1 + sum(field[2] for field in self.fields[:field_index])
+        values = rows[:, start:start + length].copy().view(
+            "S{}".format(length)).ravel()
+
+        if field_type not in "NF":
+            return values
+
+        values = np.char.strip(values)
+        values[values == b""] = b"0"
+        if field_type == "N" and decimals == 0:
+            return values.astype(np.int64)
+
+        return values.astype(np.float64)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+metrics
+
+Opt-in counters and latency histograms for the stages of the pipeline.
+
+Metrics are disabled by default and every instrumented call only pays for
+checking a flag. They can be enabled from code or by setting the
+AMTRAK_METRICS environment variable to the path of a file where metrics will
+be written when the process exits (Prometheus text format if the path ends
+with .prom, json otherwise).
+
+Example:
+    $ AMTRAK_METRICS=metrics.json python amtrak.py
+
+    from modules import metrics
+    metrics.enable()
+    amtrak.main()
+    print metrics.to_prometheus()
+"""
+
+from __future__ import unicode_literals
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+PREFIX = "amtrak"
+
+# upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10,
+           60, float("inf")]
+
+ENABLED = False
+
+_counters = {}
+_histograms = {}
+
+# guards updates of recorded metrics, which may come from many threads
+_lock = threading.Lock()
+
+
+def enable():
+    """Start recording metrics."""
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    """Stop recording metrics, already recorded ones are kept."""
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    """Forget all recorded metrics."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def incr(name, value=1):
+    """Add a value to a counter."""
+    if ENABLED:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(stage, seconds):
+    """Record the latency of one run of a stage in its histogram."""
+    if not ENABLED:
+        return
+
+    with _lock:
+        if stage not in _histograms:
+            _histograms[stage] = {"buckets": [0] * len(BUCKETS), "count": 0,
+                                  "sum": 0.0}
+
+        histogram = _histograms[stage]
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        for index, upper_bound in enumerate(BUCKETS):
+            if seconds <= upper_bound:
+                histogram["buckets"][index] += 1
+                break
+
+
+def timed(stage):
+    """Decorate a function to record its latency as a stage.
+
+    Args:
+        stage (str): Name of the stage histogram.
+    """
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(stage, time.time() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def to_dict():
+    """Return recorded counters and histograms.
+
+    Returns:
+        dict: Counters and histograms, with bucket counts per upper bound.
+
+        Example:
+            {"counters": {"lines_parsed": 30},
+             "histograms": {"parse": {"count": 30, "sum": 0.0021,
+                                      "buckets": {"0.0001": 28, ...}}}}
+    """
+
+    counters, histograms = _snapshot()
+    for stage, histogram in histograms.items():
+        histogram["buckets"] = {_format_bound(upper_bound): count for
+                                upper_bound, count in
+                                zip(BUCKETS, histogram["buckets"])}
+
+    return {"counters": counters, "histograms": histograms}
+
+
+def to_json():
+    return json.dumps(to_dict(), indent=4, sort_keys=True)
+
+
+def to_prometheus():
+    """Return recorded metrics in the Prometheus text exposition format."""
+
+    counters, histograms = _snapshot()
+
+    lines = []
+    for name in sorted(counters):
+        metric = "{}_{}_total".format(PREFIX, name)
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{} {}".format(metric, counters[name]))
+
+    metric = "{}_stage_seconds".format(PREFIX)
+    if histograms:
+        lines.append("# TYPE {} histogram".format(metric))
+
+    for stage in sorted(histograms):
+        histogram = histograms[stage]
+
+        # prometheus buckets are cumulative
+        cumulative = 0
+        for upper_bound, count in zip(BUCKETS, histogram["buckets"]):
+            cumulative += count
+            lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(
+                metric, stage, _format_bound(upper_bound), cumulative))
+
+        lines.append('{}_sum{{stage="{}"}} {}'.format(
+            metric, stage, histogram["sum"]))
+        lines.append('{}_count{{stage="{}"}} {}'.format(
+            metric, stage, histogram["count"]))
+
+    return "\n".join(lines) + "\n"
+
+
+def dump(file_name):
+    """Write recorded metrics to a file.
+
+    Args:
+        file_name (str): Path of the file. Prometheus text format is used if
+            it ends with .prom, json otherwise.
+    """
+
+    with open(file_name, "w") as f:
+        if file_name.endswith(".prom"):
+            f.write(to_prometheus())
+        else:
+            f.write(to_json())
+
+
+def _snapshot():
+    """Copy recorded counters and histograms, consistent with each other."""
+
+    with _lock:
+        histograms = {stage: {"count": histogram["count"],
+                              "sum": histogram["sum"],
+                              "buckets": list(histogram["buckets"])}
+                      for stage, histogram in _histograms.items()}
+        return dict(_counters), histograms
+
+
+def _format_bound(upper_bound):
+    return "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+
+
+if os.environ.get("AMTRAK_METRICS"):
+    enable()
+    atexit.register(dump, os.environ["AMTRAK_METRICS"])
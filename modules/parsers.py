@@ -3,11 +3,14 @@
 
 from __future__ import unicode_literals
 from pprint import pprint
-import arrow
-import parsedatetime
+import re
 
 import strategies_helpers
 
+# same day names used by arrow's english locale, without importing arrow
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+             "Saturday", "Sunday"]
+
 
 class BaseParser(object):
 
@@ -115,22 +118,71 @@ class Date(BaseParser):
     """Parse amtrak style dates."""
     FIELD_NAME = "date"
 
+    # created on first use, parsedatetime is slow to import and set up
+    _calendar = None
+
     @classmethod
     def _accepts(cls, line):
         # print "LINE: ", line, line.split()[0] in arrow.locales.EnglishLocale.day_names
         # print "line", line, len(line)
-        return line.split()[0].strip() in arrow.locales.EnglishLocale.day_names
+        return line.split()[0].strip() in DAY_NAMES
 
     @classmethod
     def _parse(cls, line):
-        cal = parsedatetime.Calendar()
+        import arrow
+
+        if cls._calendar is None:
+            import parsedatetime
+            Date._calendar = parsedatetime.Calendar()
+
         line_without_day = " ".join(line.split()[1:])
-        dt_tuple = cal.parse(line_without_day)[0][:5]
+        dt_tuple = cls._calendar.parse(line_without_day)[0][:5]
         return arrow.get(*dt_tuple)
 
 
-def get_parsers():
-    return strategies_helpers.get_strategies()
+def _is_html(text):
+    head = text[:1024].lower()
+    return "<html" in head or "<!doctype html" in head
+
+
+def _split_html_lines(text):
+    """Split an html e-mail in the text lines a reader would see."""
+    from HTMLParser import HTMLParser
+
+    text = re.sub(r"(?is)<(script|style).*?</\1>", "", text)
+    text = re.sub(r"(?i)<br\s*/?>|</(p|div|tr|li|h\d)>", "\n", text)
+    text = re.sub(r"(?i)</t[dh]>", " ", text)
+    text = HTMLParser().unescape(re.sub(r"<[^>]*>", "", text))
+
+    return [" ".join(line.split()) for line in text.splitlines()]
+
+
+FIELD_PARSERS = [Name, DepartureStation, DepartureState, DepartureCity,
+                 ArrivalStation, ArrivalState, ArrivalCity, Date,
+                 Accommodation]
+
+# thruway bus legs ("Bus:") are parsed by the same parsers of train legs
+REGISTRY = strategies_helpers.StrategiesRegistry()
+REGISTRY.register("amtrak_email", FIELD_PARSERS)
+REGISTRY.register("amtrak_email_html", FIELD_PARSERS, sniffer=_is_html,
+                  splitter=_split_html_lines)
+
+DEFAULT_FORMAT = "amtrak_email"
+
+
+def get_parsers(format_name=DEFAULT_FORMAT):
+    return REGISTRY.get_strategies(format_name)
+
+
+def get_profile(format_name=DEFAULT_FORMAT):
+    return REGISTRY.get_profile(format_name)
+
+
+def sniff_format(text):
+    """Find the itinerary format of the text of a whole document."""
+    return REGISTRY.sniff(text)
 
 if __name__ == '__main__':
-    pprint(sorted(strategies_helpers.get_strategies_names()))
+    pprint({format_name: [parser.__name__ for parser in
+                          get_parsers(format_name)]
+            for format_name in REGISTRY.get_formats()})
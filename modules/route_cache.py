@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+route_cache
+
+Cache of shortest rail routes between pairs of rail nodes.
+
+Trips go over and over through the same corridors, so routes already found
+are kept in a bounded in-memory LRU and, optionally, in a sqlite file that
+survives the process. Routes are keyed by origin node, destination node and
+a version of the rail network, so a new rail_lines shapefile never serves
+routes found in an old one.
+
+Cached routes are shared by every get, so repeated legs are served in
+microseconds without decoding or copying their geometry: lists are stored as
+tuples, which callers can't change, and only the dicts holding them are copied
+on each get. Routes are json encoded only in the sqlite file.
+
+Example:
+    from modules.route_cache import RouteCache, network_version
+    cache = RouteCache(file_name="rail/routes.sqlite",
+                       network_version=network_version("rail/rail_lines"))
+    route = cache.get(id_origin, id_destination)
+"""
+
+from __future__ import unicode_literals
+import collections
+import json
+import os
+import sqlite3
+import threading
+
+import metrics
+
+DEFAULT_MAX_SIZE = 1024
+
+
+def network_version(lines_shp_file="rail/rail_lines"):
+    """Identify a version of the rail network by its shapefile size and date.
+    """
+    stat = os.stat(lines_shp_file + ".dbf")
+    return "{}-{}".format(stat.st_size, int(stat.st_mtime))
+
+
+class RouteCache(object):
+
+    """Two tier cache of routes: memory LRU plus optional sqlite file.
+
+    Attributes:
+        max_size (int): Maximum number of routes kept in memory.
+        file_name (str): Path of the sqlite file, or None to keep routes only
+            in memory.
+        network_version (str): Version of the rail network routes belong to.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, file_name=None,
+                 network_version=""):
+        self.max_size = max_size
+        self.file_name = file_name
+        self.network_version = network_version
+
+        self._routes = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._db = None
+        if file_name:
+            self._db = sqlite3.connect(file_name, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS routes ("
+                             "version TEXT, origin TEXT, destination TEXT, "
+                             "route TEXT, "
+                             "PRIMARY KEY (version, origin, destination))")
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._routes)
+
+    def get(self, origin_node, destination_node):
+        """Get a cached route.
+
+        Returns:
+            dict: The route, with its lists turned into tuples, or None if it
+                is not cached.
+        """
+
+        key = (self.network_version, origin_node, destination_node)
+        with self._lock:
+            if key in self._routes:
+                # move the route to the end, as the most recently used
+                route = self._routes.pop(key)
+                self._routes[key] = route
+                self._count("memory_hits")
+                return _copy_dicts(route)
+
+            route = self._get_from_disk(key)
+            if route is not None:
+                route = _freeze(route)
+                self._add_to_memory(key, route)
+                self._count("disk_hits")
+                return _copy_dicts(route)
+
+            self._count("misses")
+            return None
+
+    def put(self, origin_node, destination_node, route):
+        """Cache a route, in memory and on disk.
+
+        Args:
+            route (dict): Json serializable data of the route.
+        """
+
+        key = (self.network_version, origin_node, destination_node)
+        with self._lock:
+            self._add_to_memory(key, _freeze(route))
+
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?)",
+                    [json.dumps(value) for value in key] +
+                    [json.dumps(route)])
+                self._db.commit()
+
+    def stats(self):
+        """Return hits, misses and size of the cache."""
+        stats = dict(self._stats)
+        stats["size"] = len(self._routes)
+        return stats
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    def _get_from_disk(self, key):
+        if not self._db:
+            return None
+
+        row = self._db.execute(
+            "SELECT route FROM routes WHERE version = ? AND origin = ? "
+            "AND destination = ?", [json.dumps(value) for value
+                                    in key]).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def _add_to_memory(self, key, route):
+        self._routes.pop(key, None)
+        self._routes[key] = route
+
+        while len(self._routes) > self.max_size:
+            self._routes.popitem(last=False)
+
+    def _count(self, stat):
+        self._stats[stat] += 1
+        metrics.incr("route_cache_" + stat)
+
+
+def _freeze(value):
+    """Copy a json like value turning its lists into tuples."""
+
+    if isinstance(value, dict):
+        return {key: _freeze(item) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+
+    return value
+
+
+def _copy_dicts(value):
+    """Copy the dicts of a frozen value, sharing its tuples."""
+
+    if isinstance(value, dict):
+        return {key: _copy_dicts(item) for key, item in value.items()}
+
+    return value
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+shared_graph
+
+Share one rail graph between many processes through a memory-mapped file.
+
+A `Graph` is a dictionary of lists, so every process building or unpickling
+one holds its own copy. Here the graph is published once as flat arrays in
+compressed sparse row form (sorted node ids, offsets of the links of each
+node, link targets and weights) and every process maps the same file
+read-only. The operating system keeps a single copy of the pages in memory
+no matter how many processes attach to it.
+
+Example:
+    from modules import graph, shared_graph
+    shared_graph.publish_graph(graph.build_amtrak_rail_graph(),
+                               "rail/rail_lines.graph")
+
+    # in every worker process
+    rail_graph = shared_graph.SharedGraph("rail/rail_lines.graph")
+    distance, path = rail_graph.find_shortest_path(node_a, node_b)
+"""
+
+from __future__ import unicode_literals
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import numpy as np
+
+from dijkstra import reconstruct_path
+import metrics
+
+MAGIC = b"AMSG"
+VERSION = 1
+HEADER = struct.Struct(b"<4sHxxQQ")
+
+NODE_DTYPE = np.int64
+OFFSET_DTYPE = np.int64
+TARGET_DTYPE = np.int32
+WEIGHT_DTYPE = np.float64
+
+
+def publish_graph(graph, file_name):
+    """Write a graph into a file in the shared graph format.
+
+    The graph is written into a temporary file next to it and then renamed,
+    so processes that already mapped an older version of the file keep
+    reading it untouched.
+
+    Args:
+        graph (Graph): Graph with integer node ids.
+        file_name (str): Path of the file to write.
+    """
+
+    node_ids = np.array(sorted(graph), dtype=NODE_DTYPE)
+    indexes = {node: index for index, node in enumerate(node_ids.tolist())}
+
+    offsets = np.zeros(len(node_ids) + 1, dtype=OFFSET_DTYPE)
+    targets, weights = [], []
+    for index, node in enumerate(node_ids.tolist()):
+        for node_b, weight in graph[node]:
+            targets.append(indexes[node_b])
+            weights.append(weight)
+        offsets[index + 1] = len(targets)
+
+    directory, base_name = os.path.split(os.path.abspath(file_name))
+    fd, temp_file_name = tempfile.mkstemp(prefix=base_name + ".",
+                                          dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(node_ids), len(targets)))
+            for array in [node_ids, offsets,
+                          np.array(targets, dtype=TARGET_DTYPE),
+                          np.array(weights, dtype=WEIGHT_DTYPE)]:
+                f.write(array.tobytes())
+                f.write(b"\x00" * (-array.nbytes % 8))
+        # temporary files are only readable by their owner
+        os.chmod(temp_file_name, 0o644)
+        os.rename(temp_file_name, file_name)
+    except Exception:
+        os.remove(temp_file_name)
+        raise
+
+
+class SharedGraph(object):
+
+    """Read only graph backed by a memory-mapped shared graph file.
+
+    Arrays are views over the mapped file, nothing is copied into the
+    process when attaching to it. They are dropped when the graph is closed
+    and must not be kept around after that.
+
+    Attributes:
+        file_name (str): Path of the shared graph file.
+        node_ids (numpy.ndarray): Sorted ids of all nodes.
+        offsets (numpy.ndarray): Links of the node at index i are between
+            offsets[i] and offsets[i + 1].
+        targets (numpy.ndarray): Index of the node at the end of each link.
+        weights (numpy.ndarray): Weight of each link.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+        with open(file_name, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, nodes_count, links_count = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a valid shared graph file".format(
+                file_name))
+
+        position = HEADER.size
+        arrays = []
+        for dtype, count in [(NODE_DTYPE, nodes_count),
+                             (OFFSET_DTYPE, nodes_count + 1),
+                             (TARGET_DTYPE, links_count),
+                             (WEIGHT_DTYPE, links_count)]:
+            arrays.append(np.frombuffer(self._mmap, dtype, count, position))
+            position += arrays[-1].nbytes + (-arrays[-1].nbytes % 8)
+
+        self.node_ids, self.offsets, self.targets, self.weights = arrays
+
+    def __len__(self):
+        self._check_open()
+        return len(self.node_ids)
+
+    def __contains__(self, node):
+        return self._get_index(node) is not None
+
+    def __getitem__(self, node):
+        """Weighted links of a node, like in a `Graph`."""
+
+        index = self._get_index(node)
+        if index is None:
+            raise KeyError(node)
+
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return list(zip(self.node_ids[self.targets[start:end]].tolist(),
+                        self.weights[start:end].tolist()))
+
+    def _get_index(self, node):
+        self._check_open()
+        index = int(np.searchsorted(self.node_ids, node))
+        if index < len(self.node_ids) and self.node_ids[index] == node:
+            return index
+        return None
+
+    @metrics.timed("shortest_path")
+    def find_shortest_path(self, node_a, node_b):
+        """Find shortest path between a and b nodes.
+
+        Returns:
+            tuple: Distance and the list of node ids of the path, like
+                `Graph.find_shortest_path`.
+        """
+
+        index_a, index_z = self._get_index(node_a), self._get_index(node_b)
+        assert index_a is not None
+        assert index_z is not None
+
+        distances, previous = self.search(index_a, [index_z])
+        if index_z not in distances:
+            raise KeyError(node_b)
+
+        path = reconstruct_path(previous, index_a, index_z)
+
+        return distances[index_z], self.node_ids[path].tolist()
+
+    @metrics.timed("shortest_paths")
+    def find_shortest_paths(self, node_a, nodes_b):
+        """Find shortest paths from node a to many nodes in one search.
+
+        Returns:
+            dict: Distance and path to every node of nodes_b that can be
+                reached, like `Graph.find_shortest_paths`.
+        """
+
+        index_a = self._get_index(node_a)
+        indexes_b = {self._get_index(node_b): node_b for node_b in nodes_b}
+        assert index_a is not None
+        assert None not in indexes_b
+
+        distances, previous = self.search(index_a, list(indexes_b))
+
+        paths = {}
+        for index_b, node_b in indexes_b.items():
+            if index_b in distances:
+                path = reconstruct_path(previous, index_a, index_b)
+                paths[node_b] = (distances[index_b],
+                                 self.node_ids[path].tolist())
+
+        return paths
+
+    def search(self, index_a, targets=None):
+        """Run dijkstra from a node, over node indexes.
+
+        Args:
+            index_a (int): Index of the node of origin.
+            targets (list): Indexes of nodes to reach. The search stops once
+                all of them are settled, or runs over the whole graph if it
+                is None.
+
+        Returns:
+            tuple: Dicts with the distance and the previous node of every
+                settled node, by node index.
+        """
+
+        self._check_open()
+        pending = set(targets) if targets is not None else None
+        offsets, link_targets, weights = self.offsets, self.targets, \
+            self.weights
+
+        previous, settled = {}, {}
+        heap = [(0.0, index_a, None)]
+        while heap:
+            distance, index, previous_index = heapq.heappop(heap)
+            if index in settled:
+                continue
+
+            settled[index] = distance
+            if previous_index is not None:
+                previous[index] = previous_index
+
+            if pending is not None:
+                pending.discard(index)
+                if not pending:
+                    break
+
+            start, end = offsets[index], offsets[index + 1]
+            for target, weight in zip(link_targets[start:end].tolist(),
+                                      weights[start:end].tolist()):
+                if target not in settled:
+                    heapq.heappush(heap, (distance + weight, target, index))
+
+        metrics.incr("dijkstra_nodes_settled", len(settled))
+
+        return settled, previous
+
+    def close(self):
+        """Unmap the file, the graph can't be used anymore."""
+
+        # views over a closed map would read unmapped memory
+        self.node_ids = self.offsets = self.targets = self.weights = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _check_open(self):
+        if self._mmap is None:
+            raise ValueError("shared graph {} is closed".format(
+                self.file_name))
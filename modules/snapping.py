@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+snapping
+
+Snap batches of coordinates to their nearest node of the rail network.
+
+The coordinates of all rail nodes are loaded once into numpy arrays sorted
+by the cell of a regular grid they fall in. Each coordinate is then only
+compared against the nodes of its own and the neighbouring cells, all the
+coordinates of a cell at once, using a vectorized haversine distance.
+
+Example:
+    from modules.snapping import NodeIndex
+    index = NodeIndex.from_shapefile("rail/rail_nodes")
+    node_ids, distances = index.snap([[-73.991867, 40.74968],
+                                      [-87.639168, 41.878731]])
+"""
+
+from __future__ import unicode_literals
+import numpy as np
+
+import metrics
+
+EARTH_RADIUS_KM = 6371.0
+
+# cell size, in degrees, of the grid bucketing the nodes
+CELL_SIZE = 0.2
+
+# nodes further than this, in km, are not considered close to a coordinate
+MAX_SNAP_DISTANCE = 5.0
+
+# multiplier combining the cell column and row into a single key
+_KEY_FACTOR = 1 << 20
+
+NO_NODE = -1
+
+
+def haversine(lons_a, lats_a, lons_b, lats_b):
+    """Great circle distance in km between points, element by element.
+
+    Arguments are arrays of degrees and follow numpy broadcasting rules, so
+    a column of points against a row of points gives a matrix of distances.
+    """
+
+    lons_a, lats_a, lons_b, lats_b = [np.radians(values) for values in
+                                      [lons_a, lats_a, lons_b, lats_b]]
+
+    a = np.sin((lats_b - lats_a) / 2) ** 2 + \
+        np.cos(lats_a) * np.cos(lats_b) * np.sin((lons_b - lons_a) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class NodeIndex(object):
+
+    """Spatial index of the nodes of the rail network.
+
+    Attributes:
+        node_ids (numpy.ndarray): Ids of the nodes, sorted by grid cell.
+        lons (numpy.ndarray): Longitude of each node.
+        lats (numpy.ndarray): Latitude of each node.
+        cell_size (float): Size of the grid cells in degrees.
+    """
+
+    def __init__(self, node_ids, lons, lats, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+
+        keys = self._get_keys(np.asarray(lons, dtype=np.float64),
+                              np.asarray(lats, dtype=np.float64))
+        order = np.argsort(keys, kind="mergesort")
+
+        self._keys = keys[order]
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)[order]
+        self.lons = np.asarray(lons, dtype=np.float64)[order]
+        self.lats = np.asarray(lats, dtype=np.float64)[order]
+
+    @classmethod
+    def from_shapefile(cls, nodes_shp_file="rail/rail_nodes"):
+        """Load the index from the rail_nodes shapefile."""
+        from mapped_shapefile import MappedShapefile
+
+        sf_nodes = MappedShapefile(nodes_shp_file)
+        points = sf_nodes.read_points()
+        node_ids, = sf_nodes.read_columns([0])
+        sf_nodes.close()
+
+        return cls(node_ids, points[:, 0], points[:, 1])
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def snap(self, coordinates, max_distance=MAX_SNAP_DISTANCE):
+        """Find the nearest node of each coordinate.
+
+        Only the nodes of the cell of a coordinate and its neighbouring cells
+        are searched, so the nearest node is exact as long as it is closer
+        than the size of a grid cell.
+
+        Args:
+            coordinates (list): Coordinates [lon, lat] to snap.
+            max_distance (float): Maximum distance, in km, to a node. Nodes
+                further away are not used, it should be less than the size of
+                a grid cell. If it is None, the nearest node of the
+                neighbouring cells is used even if it is further, which may
+                not be the nearest of all, and coordinates without nodes in
+                those cells are compared against every node.
+
+        Returns:
+            tuple: Arrays with the id of the nearest node of each coordinate
+                (NO_NODE if there is none close enough) and the distance to
+                it in km (inf if there is none).
+        """
+
+        points = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        node_ids = np.full(len(points), NO_NODE, dtype=np.int64)
+        distances = np.full(len(points), np.inf)
+
+        cells_x, cells_y = self._get_cells(points[:, 0], points[:, 1])
+        cells = cells_x * _KEY_FACTOR + cells_y
+
+        # snap all the coordinates falling in the same cell at once
+        for cell in np.unique(cells):
+            in_cell = np.nonzero(cells == cell)[0]
+            candidates = self._get_candidates(cells_x[in_cell[0]],
+                                              cells_y[in_cell[0]])
+            if not len(candidates):
+                # nodes outside the neighbouring cells are always further
+                # than the maximum distance
+                if max_distance is not None:
+                    continue
+                candidates = np.arange(len(self.node_ids))
+
+            self._snap_to(points, in_cell, candidates, node_ids, distances)
+            metrics.incr("snapping_candidates", len(candidates) * len(in_cell))
+
+        if max_distance is not None:
+            too_far = distances > max_distance
+            node_ids[too_far] = NO_NODE
+            distances[too_far] = np.inf
+
+        metrics.incr("snapped_coordinates", len(points))
+
+        return node_ids, distances
+
+    def _snap_to(self, points, in_cell, candidates, node_ids, distances):
+        matrix = haversine(points[in_cell, 0][:, np.newaxis],
+                           points[in_cell, 1][:, np.newaxis],
+                           self.lons[candidates][np.newaxis, :],
+                           self.lats[candidates][np.newaxis, :])
+        nearest = np.argmin(matrix, axis=1)
+
+        node_ids[in_cell] = self.node_ids[candidates[nearest]]
+        distances[in_cell] = matrix[np.arange(len(in_cell)), nearest]
+
+    def _get_candidates(self, cell_x, cell_y):
+        """Positions of the nodes in a cell and its 8 neighbours."""
+
+        ranges = []
+        for x in range(cell_x - 1, cell_x + 2):
+            first_key = x * _KEY_FACTOR + cell_y - 1
+            start = np.searchsorted(self._keys, first_key, side="left")
+            end = np.searchsorted(self._keys, first_key + 2, side="right")
+            ranges.append(np.arange(start, end))
+
+        return np.concatenate(ranges)
+
+    def _get_cells(self, lons, lats):
+        return (np.floor(lons / self.cell_size).astype(np.int64),
+                np.floor(lats / self.cell_size).astype(np.int64))
+
+    def _get_keys(self, lons, lats):
+        cells_x, cells_y = self._get_cells(lons, lats)
+        return cells_x * _KEY_FACTOR + cells_y
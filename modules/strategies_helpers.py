@@ -13,10 +13,99 @@ interface expected by the user of the strategies:
     - Class names starting with "Base" are not passed
     - Subclasses of Exception are not passed
     - Parameters class is not passed
+
+It also contains a registry where strategy modules register their strategies
+explicitly, grouped in profiles by the format of the documents they parse.
+Looking up a registered profile is cheap, unlike inspecting the stack, so it
+can be done for every line of a document.
 """
 
 from __future__ import unicode_literals
-import inspect
+
+
+class Profile(object):
+
+    """Strategies able to parse one format of documents.
+
+    Attributes:
+        name (str): Name of the format.
+        strategies (tuple): Strategy classes of the format.
+        sniffer (callable): Takes the text of a document and tells if it is
+            in this format. Profiles without sniffer are never sniffed.
+        splitter (callable): Takes the text of a document and returns the
+            lines strategies have to parse. Text is split in lines if it is
+            None.
+    """
+
+    def __init__(self, name, strategies, sniffer=None, splitter=None):
+        self.name = name
+        self.strategies = tuple(strategies)
+        self.sniffer = sniffer
+        self.splitter = splitter
+
+    def split_lines(self, text):
+        if self.splitter:
+            return self.splitter(text)
+        return text.splitlines()
+
+
+class StrategiesRegistry(object):
+
+    """Profiles of strategies registered by format.
+
+    The first profile registered is the default one, used when no sniffer
+    recognizes a document.
+    """
+
+    def __init__(self):
+        self._profiles = {}
+        self._order = []
+
+    def register(self, name, strategies, sniffer=None, splitter=None):
+        """Register the strategies that parse a format of documents.
+
+        Args:
+            name (str): Name of the format.
+            strategies (list): Strategy classes of the format.
+            sniffer (callable): Tells if the text of a document is in this
+                format.
+            splitter (callable): Splits the text of a document in lines.
+
+        Returns:
+            Profile: The registered profile.
+        """
+
+        if name in self._profiles:
+            raise ValueError("format {} is already registered".format(name))
+
+        self._profiles[name] = Profile(name, strategies, sniffer, splitter)
+        self._order.append(name)
+
+        return self._profiles[name]
+
+    def get_profile(self, name=None):
+        """Get the profile of a format, or the default one if name is None."""
+        return self._profiles[name or self._order[0]]
+
+    def get_strategies(self, name=None):
+        return self.get_profile(name).strategies
+
+    def get_formats(self):
+        return list(self._order)
+
+    def sniff(self, text):
+        """Find the format of a document.
+
+        Sniffers are tried in registration order, the default format is
+        returned if none of them recognizes the document.
+        """
+
+        for name in self._order:
+            sniffer = self._profiles[name].sniffer
+            if sniffer and sniffer(text):
+                return name
+
+        return self._order[0]
 
 
 def get_strategies_names(parent_level=2):
@@ -63,6 +152,7 @@ def get_parent_module_classes(parent_level):
     Returns:
         {"class_name": class_reference}
     """
+    import inspect
 
     parent_frame = inspect.stack()[parent_level][0]
     parent_module = inspect.getmodule(parent_frame)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_gazetteer
+
+Tests for `gazetteer` module.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+import nose
+
+from gazetteer import Gazetteer, build_gazetteer, normalize_name, \
+    get_default_tz_lookup
+
+SHP_FILE = os.path.join(os.path.dirname(__file__), "..", "amtrk_sta",
+                        "amtrk_sta")
+
+
+class GazetteerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.temp_dir, "amtrk_sta.gaz")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("New York (Penn Station), New York"),
+                         "new york penn station new york")
+
+    def test_build_and_find(self):
+
+        count = build_gazetteer(SHP_FILE, self.file_name,
+                                nodes_shp_file=None,
+                                tz_lookup=lambda coordinates: "America/X")
+        stations = Gazetteer(self.file_name)
+        self.assertEqual(len(stations), count)
+
+        station = stations.find("New York (Penn Station), New York")
+        self.assertEqual(station["code"], "NYP")
+        self.assertEqual(station["state"], "NY")
+        self.assertEqual(station["timezone"], "America/X")
+        self.assertEqual(station["node_id"], None)
+        self.assertEqual([round(coord, 6) for coord in
+                          station["coordinates"]], [-73.991867, 40.74968])
+
+        # falls back to fuzzy matching
+        station = stations.find("Chicago (Chicago Union Station)")
+        self.assertEqual(station["code"], "CHI")
+
+        stations.close()
+
+    def test_get_default_tz_lookup(self):
+
+        api_key = os.environ.pop("GOOGLE_API_KEY", None)
+        if api_key is not None:
+            self.addCleanup(os.environ.__setitem__, "GOOGLE_API_KEY", api_key)
+        self.assertEqual(get_default_tz_lookup(), None)
+
+        os.environ["GOOGLE_API_KEY"] = "key"
+        try:
+            self.assertEqual(get_default_tz_lookup().__name__,
+                             "google_time_zone")
+        finally:
+            del os.environ["GOOGLE_API_KEY"]
+
+    def test_invalid_file(self):
+
+        with open(self.file_name, "wb") as f:
+            f.write(b"not a gazetteer file")
+        self.assertRaises(ValueError, Gazetteer, self.file_name)
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
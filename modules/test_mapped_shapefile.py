@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_mapped_shapefile
+
+Tests for `mapped_shapefile` module.
+"""
+
+from __future__ import unicode_literals
+import unittest
+import nose
+import os
+import shapefile
+
+from mapped_shapefile import MappedShapefile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINES_SHP_FILE = os.path.join(BASE_DIR, "rail", "amtrak", "amtrak")
+STATIONS_SHP_FILE = os.path.join(BASE_DIR, "amtrk_sta", "amtrk_sta")
+
+
+class MappedShapefileTest(unittest.TestCase):
+
+    def test_read_columns(self):
+
+        sf_lines = MappedShapefile(LINES_SHP_FILE)
+        self.addCleanup(sf_lines.close)
+        records = shapefile.Reader(LINES_SHP_FILE).records()
+
+        miles, from_ids, to_ids = sf_lines.read_columns([1, 23, 24])
+        self.assertEqual(len(miles), len(records))
+        self.assertEqual(miles.tolist(),
+                         [float(record[1]) for record in records])
+        self.assertEqual(from_ids.tolist(),
+                         [record[23] for record in records])
+        self.assertEqual(to_ids.tolist(), [record[24] for record in records])
+
+        # columns can also be referenced by name
+        miles_by_name, = sf_lines.read_columns(["MILES"])
+        self.assertEqual(miles_by_name.tolist(), miles.tolist())
+
+    def test_read_points(self):
+
+        sf_stations = MappedShapefile(STATIONS_SHP_FILE)
+        self.addCleanup(sf_stations.close)
+        reader = shapefile.Reader(STATIONS_SHP_FILE)
+
+        points = sf_stations.read_points()
+        self.assertEqual(points.tolist(),
+                         [list(shape.points[0]) for shape in reader.shapes()])
+
+        names, = sf_stations.read_columns([1])
+        self.assertEqual([name.decode("latin-1").strip() for name in names],
+                         [record[1].decode("latin-1").strip() for record
+                          in reader.records()])
+
+    def test_shape_points(self):
+
+        sf_lines = MappedShapefile(LINES_SHP_FILE)
+        self.addCleanup(sf_lines.close)
+        shapes = shapefile.Reader(LINES_SHP_FILE).shapes()
+
+        for index in [0, 100, len(shapes) - 1]:
+            self.assertEqual(sf_lines.shape_points(index),
+                             [list(point) for point in shapes[index].points])
+        self.assertEqual(sf_lines.read_points()[100].tolist(),
+                         list(shapes[100].points[0]))
+
+        with self.assertRaises(IndexError):
+            sf_lines.shape_points(len(shapes))
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
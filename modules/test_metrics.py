@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+
+Tests for `metrics` module.
+"""
+
+from __future__ import unicode_literals
+import json
+import threading
+import unittest
+import nose
+
+import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_disabled(self):
+
+        metrics.incr("lines_parsed")
+        metrics.observe("parse", 0.002)
+        self.assertEqual(metrics.to_dict(), {"counters": {},
+                                             "histograms": {}})
+
+    def test_counters_and_histograms(self):
+
+        @metrics.timed("stage")
+        def stage(value):
+            return value * 2
+
+        metrics.enable()
+        self.assertEqual(stage(2), 4)
+        metrics.incr("lines_parsed", 3)
+        metrics.observe("parse", 0.002)
+        metrics.observe("parse", 2)
+
+        recorded = json.loads(metrics.to_json())
+        self.assertEqual(recorded["counters"], {"lines_parsed": 3})
+        self.assertEqual(recorded["histograms"]["stage"]["count"], 1)
+        self.assertEqual(recorded["histograms"]["parse"]["buckets"]["0.005"],
+                         1)
+        self.assertEqual(recorded["histograms"]["parse"]["buckets"]["5"], 1)
+
+        prometheus = metrics.to_prometheus()
+        self.assertIn("amtrak_lines_parsed_total 3", prometheus)
+        self.assertIn('amtrak_stage_seconds_bucket{stage="parse",le="5"} 2',
+                      prometheus)
+        self.assertIn('amtrak_stage_seconds_count{stage="parse"} 2',
+                      prometheus)
+
+    def test_threads(self):
+
+        def record():
+            for i in range(1000):
+                metrics.incr("requests")
+                metrics.observe("route", 0.002)
+
+        metrics.enable()
+        threads = [threading.Thread(target=record) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        recorded = metrics.to_dict()
+        self.assertEqual(recorded["counters"]["requests"], 8000)
+        self.assertEqual(recorded["histograms"]["route"]["count"], 8000)
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
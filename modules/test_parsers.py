@@ -12,7 +12,8 @@ import unittest
 import nose
 import arrow
 
-from parsers import Date, Accommodation
+from parsers import Date, Accommodation, Name, get_parsers, get_profile, \
+    sniff_format
 
 
 class ParsersTest(unittest.TestCase):
@@ -33,6 +34,24 @@ class ParsersTest(unittest.TestCase):
             "1 Reserved Coach Seat"
         )
 
+    def test_sniff_format(self):
+
+        html = ("<html><body><table><tr><td>Train:</td>"
+                "<td>49 Lake Shore Ltd.</td></tr>"
+                "<tr><td>Departure:</td><td>New York (Penn Station), "
+                "New York</td></tr></table></body></html>")
+
+        self.assertEqual(sniff_format("Train: 49 Lake Shore Ltd."),
+                         "amtrak_email")
+        self.assertEqual(sniff_format(html), "amtrak_email_html")
+
+        lines = [line for line in
+                 get_profile("amtrak_email_html").split_lines(html) if line]
+        self.assertEqual(lines, [
+            "Train: 49 Lake Shore Ltd.",
+            "Departure: New York (Penn Station), New York"])
+        self.assertTrue(Name in get_parsers("amtrak_email_html"))
+
 
 if __name__ == '__main__':
     nose.run(defaultTest=__name__)
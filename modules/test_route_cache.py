@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_route_cache
+
+Tests for `route_cache` module.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+import nose
+
+from route_cache import RouteCache
+
+
+class RouteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.temp_dir, "routes.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_lru(self):
+
+        cache = RouteCache(max_size=2)
+        cache.put(1, 2, {"distance": 1.0})
+        cache.put(2, 3, {"distance": 2.0})
+        self.assertEqual(cache.get(1, 2), {"distance": 1.0})
+
+        # (2, 3) is the least recently used route
+        cache.put(3, 4, {"distance": 3.0})
+        self.assertEqual(cache.get(2, 3), None)
+        self.assertEqual(cache.get(1, 2), {"distance": 1.0})
+        self.assertEqual(cache.stats(), {"memory_hits": 2, "disk_hits": 0,
+                                         "misses": 1, "size": 2})
+
+    def test_disk(self):
+
+        route = {"distance": 27.5, "path": [1, 5, 2]}
+        cache = RouteCache(file_name=self.file_name, network_version="v1")
+        cache.put(1, 2, route)
+        cache.close()
+
+        cache = RouteCache(file_name=self.file_name, network_version="v1")
+        self.assertEqual(cache.get(1, 2), {"distance": 27.5,
+                                           "path": (1, 5, 2)})
+        self.assertEqual(cache.get(1, 2), {"distance": 27.5,
+                                           "path": (1, 5, 2)})
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+        cache.close()
+
+        # routes of other versions of the network are not used
+        cache = RouteCache(file_name=self.file_name, network_version="v2")
+        self.assertEqual(cache.get(1, 2), None)
+        cache.close()
+
+    def test_copies(self):
+
+        route = {"distance": 3.0, "path": [1, 2, 3],
+                 "the_geom": {"type": "MultiLineString",
+                              "coordinates": [[[1, 0], [2, 0], [3, 0]]]}}
+        cache = RouteCache()
+        cache.put(1, 3, route)
+        route["path"].append(4)
+
+        cached = cache.get(1, 3)
+        cached["distance"] = 0
+        cached["the_geom"]["type"] = "LineString"
+        with self.assertRaises(AttributeError):
+            cached["path"].append(5)
+
+        self.assertEqual(cache.get(1, 3), {
+            "distance": 3.0, "path": (1, 2, 3),
+            "the_geom": {"type": "MultiLineString",
+                         "coordinates": (((1, 0), (2, 0), (3, 0)),)}})
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
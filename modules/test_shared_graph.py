@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_shared_graph
+
+Tests for `shared_graph` module.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+import nose
+
+from graph import Graph
+from shared_graph import SharedGraph, publish_graph
+
+
+class SharedGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.temp_dir, "rail.graph")
+
+        self.graph = Graph()
+        for node_a, node_b, weight in [(10, 20, 2), (20, 40, 5), (10, 30, 3),
+                                       (30, 40, 1), (20, 50, 9)]:
+            self.graph.add_edge(node_a, node_b, weight)
+            self.graph.add_edge(node_b, node_a, weight)
+
+        publish_graph(self.graph, self.file_name)
+        self.shared_graph = SharedGraph(self.file_name)
+
+    def tearDown(self):
+        self.shared_graph.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_read_only_arrays(self):
+
+        self.assertEqual(len(self.shared_graph), 5)
+        self.assertFalse(self.shared_graph.weights.flags.writeable)
+        self.assertTrue(40 in self.shared_graph)
+        self.assertFalse(41 in self.shared_graph)
+        self.assertEqual(sorted(self.shared_graph[20]),
+                         sorted(self.graph[20]))
+
+    def test_find_shortest_path(self):
+
+        self.assertEqual(self.shared_graph.find_shortest_path(10, 40),
+                         (4.0, [10, 30, 40]))
+        self.assertEqual(self.shared_graph.find_shortest_path(50, 30),
+                         self.graph.find_shortest_path(50, 30))
+
+    def test_close(self):
+
+        self.shared_graph.close()
+        with self.assertRaises(ValueError):
+            self.shared_graph.find_shortest_path(10, 40)
+        with self.assertRaises(ValueError):
+            len(self.shared_graph)
+
+    def test_publish_over_mapped_graph(self):
+
+        graph = Graph()
+        graph.add_edge(1, 2, 1)
+        graph.add_edge(2, 1, 1)
+        publish_graph(graph, self.file_name)
+
+        # processes that mapped the old file keep reading the old graph
+        self.assertEqual(self.shared_graph.find_shortest_path(10, 40),
+                         (4.0, [10, 30, 40]))
+
+        new_shared_graph = SharedGraph(self.file_name)
+        self.assertEqual(len(new_shared_graph), 2)
+        new_shared_graph.close()
+        self.assertEqual(os.listdir(self.temp_dir), ["rail.graph"])
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_snapping
+
+Tests for `snapping` module.
+"""
+
+from __future__ import unicode_literals
+import unittest
+import nose
+
+import metrics
+from snapping import NO_NODE, NodeIndex, haversine
+
+
+class SnappingTest(unittest.TestCase):
+
+    def test_haversine(self):
+
+        # one degree of latitude
+        self.assertEqual(round(haversine(0, 0, 0, 1), 1), 111.2)
+        self.assertEqual(round(haversine(-73.99, 40.75, -73.99, 40.75), 6),
+                         0)
+
+    def test_snap(self):
+
+        index = NodeIndex([1, 2, 3, 4],
+                          [-73.99, -73.98, -87.64, -120.0],
+                          [40.75, 40.76, 41.88, 10.0])
+
+        metrics.enable()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(metrics.disable)
+        node_ids, distances = index.snap([[-73.991, 40.751],
+                                          [-87.63, 41.87],
+                                          [-100.0, 30.0]])
+        self.assertEqual(node_ids.tolist(), [1, 3, NO_NODE])
+        self.assertTrue(distances[0] < 0.2)
+
+        # coordinates without nodes in the neighbouring cells are not
+        # compared against every node
+        self.assertEqual(metrics.to_dict()["counters"]["snapping_candidates"],
+                         3)
+
+        # nodes outside the neighbouring cells are used if there are none
+        node_ids, distances = index.snap([[-100.0, 30.0]], max_distance=None)
+        self.assertEqual(node_ids.tolist(), [3])
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_time_zones
+
+Tests for `time_zones` module.
+"""
+
+from __future__ import unicode_literals
+import unittest
+import nose
+from dateutil import tz
+
+from time_zones import parse_iso, format_iso, to_utc_epoch, \
+    resolve_offsets, TransitionTable
+
+
+class TimeZonesTest(unittest.TestCase):
+
+    def test_parse_and_format_iso(self):
+
+        self.assertEqual(parse_iso("2015-05-18T15:40:00+00:00"),
+                         (1431963600, 0))
+        self.assertEqual(parse_iso("2015-05-18T15:40:00.250-03:30"),
+                         (1431963600, -12600))
+        self.assertEqual(parse_iso("2015-05-18T15:40:00Z"), (1431963600, 0))
+        self.assertEqual(to_utc_epoch("2015-05-18T15:40:00-04:00"),
+                         1431963600 + 4 * 3600)
+
+        self.assertEqual(format_iso(1431963600, -14400),
+                         "2015-05-18T15:40:00-04:00")
+        self.assertEqual(format_iso(1431963600, 19800),
+                         "2015-05-18T15:40:00+05:30")
+
+    def test_resolve_offsets(self):
+
+        dates = ["2015-01-10T12:00:00", "2015-07-10T12:00:00",
+                 "2015-03-08T01:59:00", "2015-03-08T03:00:00",
+                 "2015-07-10T12:00:00", "2016-07-10T12:00:00"]
+        tzids = ["America/New_York"] * 4 + ["Asia/Kolkata",
+                                            "America/Phoenix"]
+
+        offsets = resolve_offsets([parse_iso(date)[0] for date in dates],
+                                  tzids)
+        self.assertEqual(offsets.tolist(), [-18000, -14400, -18000, -14400,
+                                            19800, -25200])
+
+        # one entry starting each year plus its transitions
+        table = TransitionTable(tz.gettz("America/New_York"))
+        table.offsets([parse_iso(dates[0])[0]])
+        self.assertEqual(table.values.tolist(), [-18000, -14400, -18000])
+
+        with self.assertRaises(ValueError):
+            resolve_offsets([0], ["Nowhere/Atlantis"])
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_topojson
+
+Tests for `topojson` module.
+"""
+
+from __future__ import unicode_literals
+import unittest
+import nose
+
+from topojson import simplify, to_topology
+
+
+class TopojsonTest(unittest.TestCase):
+
+    def test_simplify(self):
+
+        line = [[0, 0], [1, 0.1], [2, -0.1], [3, 5], [4, 6], [5, 7]]
+        self.assertEqual(simplify(line, 0.5), [[0, 0], [2, -0.1], [3, 5],
+                                               [5, 7]])
+        self.assertEqual(simplify(line, 10), [[0, 0], [5, 7]])
+        self.assertEqual(simplify(line, 0), line)
+
+    def test_to_topology_shared_arcs(self):
+
+        # both services run through the same stretch from (1, 0) to (2, 0)
+        geojson_dict = {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"name": "a"},
+             "geometry": {"type": "MultiLineString",
+                          "coordinates": [[[0, 0], [1, 0], [2, 0]]]}},
+            {"type": "Feature", "properties": {"name": "b"},
+             "geometry": {"type": "MultiLineString",
+                          "coordinates": [[[2, 0], [1, 0], [1, 1]]]}}]}
+
+        topology = to_topology(geojson_dict, quantization=3)
+        geometries = topology["objects"]["features"]["geometries"]
+
+        self.assertEqual(len(topology["arcs"]), 3)
+        self.assertEqual(geometries[0]["arcs"], [[0, 1]])
+        self.assertEqual(geometries[1]["arcs"], [[~1, 2]])
+        self.assertEqual(geometries[1]["properties"], {"name": "b"})
+
+
+if __name__ == '__main__':
+    nose.run(defaultTest=__name__)
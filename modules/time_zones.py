@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+time_zones
+
+Resolve the UTC offsets of many local dates at once.
+
+Dates are kept as integer epochs of their local wall clock (the seconds since
+1970-01-01 00:00 as if the wall clock was UTC) plus the id of their time zone.
+The offsets of a time zone only change at a few transitions a year, so each
+time zone gets a table of the local times where its offset changes, built once
+a year and cached, and the offsets of all the dates of a time zone are looked
+up in the table at once. Dates are only formatted back to ISO 8601 strings when
+they are written out.
+
+Offsets are the ones given by dateutil, the time zone library used by arrow.
+
+Example:
+    from modules import time_zones
+    local_epoch, offset = time_zones.parse_iso("2015-05-18T15:40:00+00:00")
+    offsets = time_zones.resolve_offsets([local_epoch], ["America/New_York"])
+    time_zones.format_iso(local_epoch, offsets[0])
+    # "2015-05-18T15:40:00-04:00"
+"""
+
+from __future__ import unicode_literals
+import calendar
+import datetime
+import os
+import time
+import numpy as np
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+DAY = 24 * 60 * 60
+
+GOOGLE_TIME_ZONE_URL = "https://maps.googleapis.com/maps/api/timezone/json"
+
+# transition tables already built, by time zone id
+_transition_tables = {}
+
+
+def parse_iso(date_string):
+    """Split an ISO 8601 date into its local epoch and its UTC offset.
+
+    Args:
+        date_string (str): Date like "2015-05-18T15:40:00+00:00", fractions
+            of second are ignored and a missing offset means UTC.
+
+    Returns:
+        tuple: Local epoch and offset, both in seconds.
+    """
+
+    days = datetime.date(int(date_string[0:4]), int(date_string[5:7]),
+                         int(date_string[8:10])).toordinal() - EPOCH_ORDINAL
+    local_epoch = days * DAY + int(date_string[11:13]) * 3600 + \
+        int(date_string[14:16]) * 60 + int(date_string[17:19])
+
+    designator = date_string[19:].lstrip("0123456789.")
+    if not designator or designator == "Z":
+        return local_epoch, 0
+
+    sign = -1 if designator[0] == "-" else 1
+    hours, minutes = designator[1:3], designator[-2:]
+
+    return local_epoch, sign * (int(hours) * 3600 + int(minutes) * 60)
+
+
+def to_utc_epoch(date_string):
+    """Convert an ISO 8601 date into seconds since 1970-01-01 UTC."""
+    local_epoch, offset = parse_iso(date_string)
+    return local_epoch - offset
+
+
+def format_iso(local_epoch, offset):
+    """Format a local epoch with its UTC offset as an ISO 8601 date."""
+
+    date = EPOCH + datetime.timedelta(seconds=int(local_epoch))
+    sign = "-" if offset < 0 else "+"
+    hours, minutes = divmod(abs(int(offset)) // 60, 60)
+
+    return "{}{}{:02d}:{:02d}".format(date.strftime(ISO_FORMAT), sign, hours,
+                                      minutes)
+
+
+def google_time_zone(coordinates, timestamp=None):
+    """Get the time zone id of a point from the Google Time Zone API.
+
+    Args:
+        coordinates (list): Given coordinates [lon, lat].
+        timestamp (int): Unix timestamp the time zone is asked for, now if it
+            is None. Ids don't change with time, only their offsets do.
+
+    Returns:
+        str: Time zone id, like "America/New_York". Needs the GOOGLE_API_KEY
+            environment variable.
+    """
+    import requests
+
+    if not os.environ.get("GOOGLE_API_KEY"):
+        raise RuntimeError("time zones can't be retrieved, the "
+                           "GOOGLE_API_KEY environment variable is not set")
+
+    payload = {"location": ",".join([unicode(i) for i in
+                                     reversed(coordinates)]),
+               "timestamp": int(time.time() if timestamp is None
+                                else timestamp),
+               "key": os.environ["GOOGLE_API_KEY"]}
+
+    return requests.get(GOOGLE_TIME_ZONE_URL, payload).json()["timeZoneId"]
+
+
+def get_transition_table(tzid):
+    """Get the transition table of a time zone, cached by id."""
+
+    if tzid not in _transition_tables:
+        from dateutil import tz
+
+        tzinfo = tz.gettz(tzid)
+        if tzinfo is None:
+            raise ValueError("unknown time zone {}".format(tzid))
+        _transition_tables[tzid] = TransitionTable(tzinfo)
+
+    return _transition_tables[tzid]
+
+
+def resolve_offsets(local_epochs, tzids):
+    """Find the UTC offsets of local dates in their time zones.
+
+    Dates are grouped by time zone and the offsets of each group are looked
+    up in the transition table of the time zone at once.
+
+    Args:
+        local_epochs (list): Local epochs of the dates.
+        tzids (list): Time zone id of each date.
+
+    Returns:
+        numpy.ndarray: UTC offset of each date, in seconds.
+    """
+
+    local_epochs = np.asarray(local_epochs, dtype=np.int64)
+    tzids = np.asarray(tzids)
+    offsets = np.zeros(len(local_epochs), dtype=np.int64)
+
+    for tzid in np.unique(tzids):
+        in_tz = tzids == tzid
+        offsets[in_tz] = get_transition_table(tzid).offsets(
+            local_epochs[in_tz])
+
+    return offsets
+
+
+class TransitionTable(object):
+
+    """Local times where the UTC offset of a time zone changes.
+
+    Years are added to the table as dates falling in them are looked up. Each
+    year starts a new entry, so every looked up date falls after an entry of
+    its own year.
+
+    Attributes:
+        tzinfo (datetime.tzinfo): The time zone.
+        starts (numpy.ndarray): Sorted local epochs where each offset starts.
+        values (numpy.ndarray): UTC offset, in seconds, from each start.
+    """
+
+    def __init__(self, tzinfo):
+        self.tzinfo = tzinfo
+        self._years = set()
+        self._transitions = {}
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=np.int64)
+
+    def offsets(self, local_epochs):
+        """Look up the UTC offsets, in seconds, of local epochs."""
+
+        local_epochs = np.asarray(local_epochs, dtype=np.int64)
+        years = (EPOCH + datetime.timedelta(seconds=int(epoch))
+                 for epoch in np.unique(local_epochs // DAY) * DAY)
+        new_years = set(date.year for date in years) - self._years
+        if new_years:
+            self._add_years(new_years)
+
+        positions = np.searchsorted(self.starts, local_epochs, side="right")
+        return self.values[positions - 1]
+
+    def _add_years(self, years):
+        for year in years:
+            start = calendar.timegm((year, 1, 1, 0, 0, 0))
+            end = calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+
+            offset = self._get_offset(start)
+            self._transitions[start] = offset
+
+            # sample a day at a time and search changes to the second
+            for day in range(start + DAY, end, DAY):
+                day_offset = self._get_offset(day)
+                if day_offset != offset:
+                    self._transitions[self._find_change(day - DAY, day)] = \
+                        day_offset
+                    offset = day_offset
+
+            self._years.add(year)
+
+        self.starts = np.array(sorted(self._transitions), dtype=np.int64)
+        self.values = np.array([self._transitions[start] for start
+                                in self.starts.tolist()], dtype=np.int64)
+
+    def _find_change(self, before, after):
+        """First local epoch with the offset of after, searching from before.
+        """
+
+        offset = self._get_offset(before)
+        while after - before > 1:
+            middle = (before + after) // 2
+            if self._get_offset(middle) == offset:
+                before = middle
+            else:
+                after = middle
+
+        return after
+
+    def _get_offset(self, local_epoch):
+        date = EPOCH + datetime.timedelta(seconds=local_epoch)
+        delta = self.tzinfo.utcoffset(date.replace(tzinfo=self.tzinfo))
+        return delta.days * DAY + delta.seconds
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+topojson
+
+Convert geojson feature collections into simplified and quantized TopoJSON.
+
+Lines of different services that run through the same stretch of rail are
+stored only once, as a shared arc, and every arc is simplified with the
+Douglas-Peucker algorithm using a tolerance that matches the pixel size of a
+given zoom level. This keeps the files handed to the web map small no matter
+how many services are drawn.
+"""
+
+from __future__ import unicode_literals
+import math
+
+DEFAULT_QUANTIZATION = 100000
+TILE_SIZE = 256
+
+
+def zoom_tolerance(zoom):
+    """Degrees covered by one pixel at a given web map zoom level."""
+    return 360.0 / (TILE_SIZE * math.pow(2, zoom))
+
+
+def simplify(points, tolerance):
+    """Simplify a line with the Douglas-Peucker algorithm.
+
+    Args:
+        points (list): Coordinates of the line [[x, y], [x, y], ...]
+        tolerance (float): Maximum distance a removed point can have to the
+            simplified line, in the same units as the coordinates.
+
+    Returns:
+        list: Points of the simplified line. First and last points are always
+            kept.
+    """
+
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+
+        max_dist, max_index = 0, None
+        for index in range(first + 1, last):
+            dist = _point_segment_distance(points[index], points[first],
+                                           points[last])
+            if dist > max_dist:
+                max_dist, max_index = dist, index
+
+        if max_index is not None and max_dist > tolerance:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _point_segment_distance(point, start, end):
+    """Distance from a point to the segment between start and end."""
+
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(point[0] - start[0], point[1] - start[1])
+
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / \
+        float(dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+
+    return math.hypot(point[0] - (start[0] + t * dx),
+                      point[1] - (start[1] + t * dy))
+
+
+def to_topology(geojson_dict, object_name="features",
+                quantization=DEFAULT_QUANTIZATION, zoom=None):
+    """Convert a geojson feature collection into a TopoJSON topology.
+
+    Args:
+        geojson_dict (dict): Geojson formated feature collection with Point,
+            LineString or MultiLineString geometries.
+        object_name (str): Name of the geometry collection in the topology.
+        quantization (int): Number of distinct values per axis.
+        zoom (int): Web map zoom level used to pick the simplification
+            tolerance. No simplification is done if it is None.
+
+    Returns:
+        dict: Formated like a topojson file.
+    """
+
+    features = geojson_dict["features"]
+    bbox = _get_bbox(features)
+    scale, translate = _get_transform(bbox, quantization)
+
+    def quantize(coord):
+        return (int(round((coord[0] - translate[0]) / scale[0])),
+                int(round((coord[1] - translate[1]) / scale[1])))
+
+    # quantize every line of every feature before looking for shared arcs
+    lines = []
+    for feature in features:
+        for line in _get_lines(feature["geometry"]):
+            quantized = _remove_repeated([quantize(coord) for coord in line])
+            if len(quantized) > 1:
+                lines.append(quantized)
+
+    arcs, arcs_index = [], {}
+    junctions = _find_junctions(lines)
+    tolerance = 0 if zoom is None else \
+        zoom_tolerance(zoom) / min(scale[0], scale[1])
+
+    geometries = []
+    for feature in features:
+        geometry = feature["geometry"]
+        topo_geometry = {"type": geometry["type"],
+                         "properties": feature["properties"]}
+
+        if geometry["type"] == "Point":
+            topo_geometry["coordinates"] = list(
+                quantize(geometry["coordinates"]))
+        else:
+            topo_lines = []
+            for line in _get_lines(geometry):
+                quantized = _remove_repeated([quantize(coord) for coord
+                                              in line])
+                if len(quantized) > 1:
+                    topo_lines.append(
+                        [_get_arc_index(arc, arcs, arcs_index, tolerance)
+                         for arc in _cut_line(quantized, junctions)])
+
+            if geometry["type"] == "LineString":
+                topo_geometry["arcs"] = topo_lines[0] if topo_lines else []
+            else:
+                topo_geometry["arcs"] = topo_lines
+
+        geometries.append(topo_geometry)
+
+    return {"type": "Topology",
+            "transform": {"scale": scale, "translate": translate},
+            "bbox": bbox,
+            "objects": {object_name: {"type": "GeometryCollection",
+                                      "geometries": geometries}},
+            "arcs": [_delta_encode(arc) for arc in arcs]}
+
+
+def _get_lines(geometry):
+    """Return the lines of a geojson geometry as a list of point lists."""
+
+    if geometry["type"] == "LineString":
+        return [geometry["coordinates"]]
+    elif geometry["type"] == "MultiLineString":
+        return geometry["coordinates"]
+    else:
+        return []
+
+
+def _get_bbox(features):
+    """Calculate [min_x, min_y, max_x, max_y] of all features."""
+
+    xs, ys = [], []
+    for feature in features:
+        geometry = feature["geometry"]
+        if geometry["type"] == "Point":
+            coords = [geometry["coordinates"]]
+        else:
+            coords = [coord for line in _get_lines(geometry)
+                      for coord in line]
+
+        xs.extend(coord[0] for coord in coords)
+        ys.extend(coord[1] for coord in coords)
+
+    if not xs:
+        return [0, 0, 0, 0]
+
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def _get_transform(bbox, quantization):
+    """Calculate scale and translate of the topojson transform."""
+
+    x0, y0, x1, y1 = bbox
+    kx = (x1 - x0) / float(quantization - 1) if x1 > x0 else 1.0
+    ky = (y1 - y0) / float(quantization - 1) if y1 > y0 else 1.0
+
+    return [kx, ky], [x0, y0]
+
+
+def _remove_repeated(points):
+    """Remove consecutive repeated points produced by quantization."""
+
+    cleaned = points[:1]
+    for point in points[1:]:
+        if point != cleaned[-1]:
+            cleaned.append(point)
+
+    return cleaned
+
+
+def _find_junctions(lines):
+    """Find the points where lines meet, split or end.
+
+    A point is a junction if it is the end of a line or if it is reached
+    from different neighbours in different lines.
+    """
+
+    junctions = set()
+    neighbours = {}
+
+    for line in lines:
+        junctions.add(line[0])
+        junctions.add(line[-1])
+
+        for index in range(1, len(line) - 1):
+            pair = frozenset([line[index - 1], line[index + 1]])
+            point = line[index]
+
+            if point not in neighbours:
+                neighbours[point] = pair
+            elif neighbours[point] != pair:
+                junctions.add(point)
+
+    return junctions
+
+
+def _cut_line(line, junctions):
+    """Cut a line in arcs at every junction."""
+
+    arc = [line[0]]
+    for point in line[1:]:
+        arc.append(point)
+        if point in junctions and point != line[-1]:
+            yield arc
+            arc = [point]
+
+    yield arc
+
+
+def _get_arc_index(arc, arcs, arcs_index, tolerance):
+    """Get the index of an arc, adding it to the arcs list if it is new.
+
+    Arcs already stored in the opposite direction are referenced with the
+    one's complement of their index, as the topojson spec requires.
+    """
+
+    key = tuple(arc)
+    if key in arcs_index:
+        return arcs_index[key]
+
+    reversed_key = tuple(reversed(arc))
+    if reversed_key in arcs_index:
+        return ~arcs_index[reversed_key]
+
+    arcs.append(simplify(arc, tolerance))
+    arcs_index[key] = len(arcs) - 1
+
+    return arcs_index[key]
+
+
+def _delta_encode(arc):
+    """Encode an arc as a first point followed by relative offsets."""
+
+    encoded, previous = [], (0, 0)
+    for point in arc:
+        encoded.append([point[0] - previous[0], point[1] - previous[1]])
+        previous = point
+
+    return encoded
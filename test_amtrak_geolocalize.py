@@ -8,10 +8,20 @@ Tests for `amatrak_geolocalize` module.
 """
 
 from __future__ import unicode_literals
+import json
+import os
+import shutil
+import tempfile
 import unittest
 # import nose
 
-from amtrak_geolocalize import find_coordinates, _calculate_coord_diff
+import amtrak_geolocalize
+from amtrak_geolocalize import find_coordinates, create_stations_table, \
+    route_trip, create_route_pool, correct_services_time_zones, add_duration
+from modules import gazetteer
+from modules.graph import Graph
+from modules.route_cache import RouteCache
+from modules.shared_graph import SharedGraph, publish_graph
 
 
 class AmtrakGeolocalizeTest(unittest.TestCase):
@@ -28,14 +38,210 @@ class AmtrakGeolocalizeTest(unittest.TestCase):
         exp_coord = ([-87.639168, 41.878731])
         self.assertEqual(coord, exp_coord)
 
-    def test_calculate_coord_diff(self):
+    def test_write_services_to_topojson(self):
 
-        self.assertEqual(round(_calculate_coord_diff([9, 10], [10, 10]), 7),
-                         0.1)
-        self.assertEqual(round(_calculate_coord_diff([9, 8], [10, 10]), 7),
-                         0.2)
-        self.assertEqual(round(_calculate_coord_diff([8, 9], [10, 10]), 7),
-                         0.2)
+        geojson_dict = amtrak_geolocalize.to_geojson_format([
+            {"name": "49 Lake Shore Ltd.",
+             "the_geom": {"type": "MultiLineString",
+                          "coordinates": [[[-73.99, 40.75],
+                                           [-87.64, 41.88]]]}}])
+
+        # a file name without directory is written in the current one
+        temp_dir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(temp_dir)
+        try:
+            amtrak_geolocalize.write_services_to_topojson(geojson_dict, "out",
+                                                          zooms=[4])
+            self.assertEqual(os.listdir("."), ["out-z4.topojson"])
+
+            amtrak_geolocalize.write_services_to_topojson(
+                geojson_dict, "stations", zooms=[4], object_name="stations")
+            with open("stations-z4.topojson") as f:
+                self.assertEqual(list(json.load(f)["objects"]), ["stations"])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(temp_dir)
+
+    def test_create_stations_table(self):
+
+        services = []
+        for name, departure, arrival, dates in [
+                ("5 California Zephyr", "Chicago", "Emeryville",
+                 ["2015-05-20T14:00:00-05:00", "2015-05-22T16:10:00-07:00"]),
+                ("712 San Joaquin", "Emeryville", "Bakersfield",
+                 ["2015-05-26T07:40:00-07:00", "2015-05-26T13:41:00-07:00"])]:
+            services.append({
+                "name": name,
+                "departure_station": departure + ", State",
+                "departure_city": departure,
+                "departure_state": "State",
+                "departure_coordinates": [0, 1],
+                "departure_date": dates[0],
+                "arrival_station": arrival + ", State",
+                "arrival_city": arrival,
+                "arrival_state": "State",
+                "arrival_coordinates": [0, 2],
+                "arrival_date": dates[1],
+                "the_geom": {}})
+
+        table = create_stations_table(services)
+
+        self.assertEqual([station["city"] for station in table["stations"]],
+                         ["Chicago", "Emeryville", "Bakersfield"])
+        self.assertEqual(table["stations"][1]["visits"], [
+            {"service": "5 California Zephyr",
+             "arrival_date": "2015-05-22T16:10:00-07:00"},
+            {"service": "712 San Joaquin",
+             "departure_date": "2015-05-26T07:40:00-07:00"}])
+        self.assertEqual(table["services"][1], {
+            "name": "712 San Joaquin",
+            "departure_station_id": 1,
+            "departure_date": "2015-05-26T07:40:00-07:00",
+            "arrival_station_id": 2,
+            "arrival_date": "2015-05-26T13:41:00-07:00"})
+
+    def test_route_trip(self):
+
+        graph = Graph()
+        for node_a, node_b, weight in [(1, 2, 2), (2, 3, 1), (1, 3, 5),
+                                       (3, 4, 4)]:
+            graph.add_edge(node_a, node_b, weight)
+            graph.add_edge(node_b, node_a, weight)
+
+        # stations already snapped to nodes 1 to 4
+        for node in range(1, 5):
+            amtrak_geolocalize._node_ids_cache[(node, 0)] = node
+            amtrak_geolocalize._nodes_coordinates[node] = [node, 0]
+        self.addCleanup(amtrak_geolocalize._node_ids_cache.clear)
+        self.addCleanup(amtrak_geolocalize._nodes_coordinates.clear)
+
+        services = [{"departure_coordinates": [departure, 0],
+                     "arrival_coordinates": [arrival, 0]}
+                    for departure, arrival in [(1, 3), (3, 4), (1, 4), (3, 4)]]
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            publish_graph(graph, os.path.join(temp_dir, "rail.graph"))
+            shared_graph = SharedGraph(os.path.join(temp_dir, "rail.graph"))
+            pool = create_route_pool(shared_graph, 2)
+            try:
+                parallel_routes = route_trip(services, shared_graph,
+                                             pool=pool)
+            finally:
+                pool.close()
+                pool.join()
+            shared_graph.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+        cache = RouteCache()
+        routes = route_trip(services, graph, cache)
+
+        self.assertEqual([route["distance"] for route in routes],
+                         [3.0, 4.0, 7.0, 4.0])
+        self.assertEqual(routes[2]["path"], [1, 2, 3, 4])
+        self.assertEqual(routes[2]["the_geom"]["coordinates"],
+                         [[[1, 0], [2, 0], [3, 0], [4, 0]]])
+        self.assertEqual(parallel_routes, routes)
+        self.assertEqual(cache.stats()["size"], 3)
+
+        # legs without a rail node or without a path get no route
+        graph.add_edge(5, 6, 1)
+        amtrak_geolocalize._node_ids_cache[(5, 0)] = 5
+        amtrak_geolocalize._node_ids_cache[(9, 0)] = None
+        services = [{"departure_coordinates": [departure, 0],
+                     "arrival_coordinates": [arrival, 0]}
+                    for departure, arrival in [(1, 3), (3, 5), (5, 9)]]
+        routes = route_trip(services, graph, cache)
+
+        self.assertEqual(routes[0]["distance"], 3.0)
+        self.assertEqual(routes[1:], [None, None])
+
+    def test_path_to_geojson(self):
+
+        amtrak_geolocalize._nodes_coordinates.update({1: [1, 0], 2: [2, 0]})
+        self.addCleanup(amtrak_geolocalize._nodes_coordinates.clear)
+
+        self.assertEqual(amtrak_geolocalize._path_to_geojson([1, 2]),
+                         {"type": "MultiLineString",
+                          "coordinates": [[[1, 0], [2, 0]]]})
+
+        # nodes without coordinates are a data error, not dropped
+        with self.assertRaises(ValueError):
+            amtrak_geolocalize._path_to_geojson([1, 7, 2])
+
+    def test_correct_services_time_zones(self):
+
+        # time zones already retrieved, without calling the Google API
+        amtrak_geolocalize._tz_cache.update({(1, 0): "America/New_York",
+                                             (2, 0): "America/Chicago"})
+        self.addCleanup(amtrak_geolocalize._tz_cache.clear)
+
+        services = [{"departure_coordinates": [1, 0],
+                     "departure_date": "2015-05-18T15:40:00+00:00",
+                     "arrival_coordinates": [2, 0],
+                     "arrival_date": "2015-05-19T09:45:00+00:00"},
+                    {"departure_coordinates": [2, 0],
+                     "departure_date": "2015-11-01T01:30:00+00:00",
+                     "arrival_coordinates": [1, 0],
+                     "arrival_date": "2015-12-24T23:59:00+00:00"}]
+
+        correct_services_time_zones(services)
+        for service in services:
+            add_duration(service)
+
+        self.assertEqual(services[0]["departure_date"],
+                         "2015-05-18T15:40:00-04:00")
+        self.assertEqual(services[0]["arrival_date"],
+                         "2015-05-19T09:45:00-05:00")
+        self.assertEqual(services[0]["duration"], 19.1)
+        self.assertEqual(services[1]["departure_date"],
+                         "2015-11-01T01:30:00-05:00")
+        self.assertEqual(services[1]["arrival_date"],
+                         "2015-12-24T23:59:00-05:00")
+
+    def test_correct_services_time_zones_from_gazetteer(self):
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        shp_file = os.path.join(temp_dir, "amtrk_sta")
+        for extension in ["shp", "shx", "dbf"]:
+            shutil.copy("amtrk_sta/amtrk_sta." + extension,
+                        "{}.{}".format(shp_file, extension))
+        gazetteer.build_gazetteer(shp_file, shp_file + ".gaz",
+                                  nodes_shp_file=None,
+                                  tz_lookup=lambda coordinates:
+                                  "America/Chicago")
+        self.addCleanup(
+            lambda: amtrak_geolocalize._gazetteers.pop(shp_file + ".gaz")[1]
+            .close())
+
+        # the Google API is never asked for stations of the gazetteer
+        amtrak_geolocalize._tz_cache[(1, 0)] = "America/New_York"
+        self.addCleanup(amtrak_geolocalize._tz_cache.clear)
+
+        services = [{"departure_station": "New York (Penn Station), New York",
+                     "departure_coordinates": [-73.991867, 40.74968],
+                     "departure_date": "2015-05-18T15:40:00+00:00",
+                     "arrival_coordinates": [1, 0],
+                     "arrival_date": "2015-05-19T09:45:00+00:00"}]
+        correct_services_time_zones(services, shp_file)
+
+        self.assertEqual(services[0]["departure_date"],
+                         "2015-05-18T15:40:00-05:00")
+        self.assertEqual(services[0]["arrival_date"],
+                         "2015-05-19T09:45:00-04:00")
+
+        # a gazetteer rebuilt while the process runs is opened again
+        gazetteer.build_gazetteer(shp_file, shp_file + ".gaz",
+                                  nodes_shp_file=None,
+                                  tz_lookup=lambda coordinates:
+                                  "America/Denver")
+        os.utime(shp_file + ".gaz", (2e9, 2e9))
+        self.assertEqual(amtrak_geolocalize._get_gazetteer(shp_file).find(
+            "New York (Penn Station), New York")["timezone"],
+            "America/Denver")
 
 
 if __name__ == '__main__':
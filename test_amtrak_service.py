@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_amtrak_service
+
+Tests for `amtrak_service` module.
+"""
+
+from __future__ import unicode_literals
+import json
+import threading
+import unittest
+import urllib2
+
+import amtrak_geolocalize
+from amtrak_service import AmtrakService, ServiceClient, create_server
+from modules.graph import Graph
+from modules.route_cache import RouteCache
+
+
+class AmtrakServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        graph = Graph()
+        for node_a, node_b, weight in [(1, 2, 2), (2, 3, 1), (1, 3, 5)]:
+            graph.add_edge(node_a, node_b, weight)
+            graph.add_edge(node_b, node_a, weight)
+
+        # coordinates of the nodes, without reading the rail_nodes shapefile
+        for node in range(1, 4):
+            amtrak_geolocalize._nodes_coordinates[node] = [node, 0]
+        self.addCleanup(amtrak_geolocalize._nodes_coordinates.clear)
+
+        self.service = AmtrakService(processes=0, graph=graph,
+                                     route_cache=RouteCache())
+        self.client = ServiceClient(self.service)
+
+    def test_parse(self):
+
+        with open("test_trip.txt") as f:
+            status, response = self.client.post("/parse", {"text": f.read()})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(response["services"]), 1)
+        self.assertEqual(response["services"][0]["name"],
+                         "49 Lake Shore Ltd.")
+        self.assertEqual(response["services"][0]["duration"], 18.1)
+
+    def test_geolocate(self):
+
+        service = {"name": "49 Lake Shore Ltd.",
+                   "departure_station": "New York (Penn Station), New York",
+                   "departure_date": "2015-05-18T15:40:00+00:00",
+                   "arrival_station": "Chicago (Union Station), Illinois",
+                   "arrival_date": "2015-05-19T09:45:00+00:00"}
+        status, response = self.client.post("/geolocate",
+                                            {"services": [service]})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response["services"][0]["the_geom"]["coordinates"],
+                         [[[-73.991867, 40.74968], [-87.639168, 41.878731]]])
+
+    def test_route(self):
+
+        status, response = self.client.post(
+            "/route", {"origin_node": 1, "destination_node": 3})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response["distance"], 3.0)
+        self.assertEqual(response["path"], [1, 2, 3])
+
+        self.client.post("/route", {"origin_node": 1, "destination_node": 3})
+        self.assertEqual(self.client.get("/health")[1]["route_cache"],
+                         {"memory_hits": 1, "disk_hits": 0, "misses": 1,
+                          "size": 1})
+
+    def test_lazy_route_cache(self):
+
+        # the rail_lines shapefile is only read by the first route
+        service = AmtrakService(lines_shp_file="missing/rail_lines",
+                                processes=0)
+        status, response = ServiceClient(service).get("/health")
+        service.close()
+
+        self.assertEqual(status, 200)
+        self.assertEqual(response["route_cache"], None)
+
+    def test_errors(self):
+
+        self.assertEqual(self.client.get("/unknown")[0], 404)
+        self.assertEqual(self.client.post("/route", {})[0], 400)
+        self.assertEqual(self.service.handle("POST", "/parse", "{")[0], 400)
+        self.assertEqual(self.service.handle("POST", "/parse", "[]")[0], 400)
+        self.assertEqual(self.client.post("/parse", {"text": 5})[0], 400)
+        self.assertEqual(self.client.post("/geolocate",
+                                          {"services": "x"})[0], 400)
+        self.assertEqual(self.client.post("/geolocate",
+                                          {"services": [{"name": "x"}]})[0],
+                         400)
+        self.assertEqual(self.client.post(
+            "/route", {"origin_node": "1", "destination_node": 3})[0], 400)
+
+    def test_route_errors(self):
+
+        # unknown node
+        status, response = self.client.post(
+            "/route", {"origin_node": 1, "destination_node": 99})
+        self.assertEqual(status, 404)
+        self.assertEqual(response["error"], "unknown rail node 99")
+
+        # node not connected to the others
+        self.service.graph[5] = []
+        status, response = self.client.post(
+            "/route", {"origin_node": 1, "destination_node": 5})
+        self.assertEqual(status, 422)
+
+        # station without a rail node near it
+        original = amtrak_geolocalize.find_station_node
+        amtrak_geolocalize.find_station_node = lambda station, shp_file: None
+        try:
+            status, response = self.client.post(
+                "/route", {"origin": "Nowhere", "destination": "Nowhere"})
+        finally:
+            amtrak_geolocalize.find_station_node = original
+        self.assertEqual(status, 422)
+
+    def test_internal_error(self):
+
+        def fail(data):
+            raise ValueError("unexpected")
+
+        self.service.health = fail
+        status, response = self.client.get("/health")
+        self.assertEqual(status, 500)
+        self.assertEqual(response["error"], "ValueError: unexpected")
+
+    def test_http_server(self):
+
+        server = create_server(self.service, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            url = "http://127.0.0.1:{}".format(server.server_port)
+            response = json.loads(urllib2.urlopen(url + "/health").read())
+
+            # errors are answered with their status, not dropped
+            with self.assertRaises(urllib2.HTTPError) as context:
+                urllib2.urlopen(url + "/route", json.dumps(
+                    {"origin_node": 1, "destination_node": 99}))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(response["status"], "ok")
+        self.assertEqual(context.exception.code, 404)
+        self.assertEqual(json.loads(context.exception.read())["error"],
+                         "unknown rail node 99")
+
+
+if __name__ == '__main__':
+    unittest.main()